@@ -0,0 +1,56 @@
+import json
+import os
+
+import click
+
+from tetris.model.benchmark import (
+    BENCHMARKS,
+    REGRESSION_THRESHOLD,
+    REPEAT_COUNT,
+    compare_benchmark_results,
+    get_benchmark_report,
+    run_benchmarks,
+)
+
+
+@click.command()
+@click.option("--only", multiple=True, help="Run only this benchmark; may be repeated.")
+@click.option("--ui", is_flag=True, help="Also run the display frame benchmarks, drawing to SDL's dummy video driver.")
+@click.option("--repeat-count", default=REPEAT_COUNT, help="Number of times each benchmark is repeated; the fastest repeat is kept.")
+@click.option("--baseline", default="../config/benchmark_baseline.json", help="Baseline results in JSON format to compare against, if the file exists.")
+@click.option("--save-baseline", is_flag=True, help="Save the results as the new baseline instead of comparing against it.")
+@click.option("--output", default=None, help="Output file for the results in JSON format.")
+@click.option("--threshold", default=REGRESSION_THRESHOLD, help="Fraction by which a benchmark must be slower than its baseline to count as a regression.")
+def bench(only, ui, repeat_count, baseline, save_baseline, output, threshold):
+    benchmarks = BENCHMARKS
+    if ui:
+        # before pygame is imported, so no window is opened
+        os.environ["SDL_VIDEODRIVER"] = "dummy"
+        from tetris.ui.benchmark import UI_BENCHMARKS
+        benchmarks += UI_BENCHMARKS
+
+    unknown_names = set(only) - {b.name for b in benchmarks}
+    if unknown_names:
+        raise click.BadParameter(f"unknown benchmarks {', '.join(sorted(unknown_names))}", param_hint="--only")
+
+    results = run_benchmarks(only or None, repeat_count, benchmarks)
+
+    comparisons = None
+    if save_baseline:
+        with open(baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    elif os.path.exists(baseline):
+        with open(baseline) as f:
+            comparisons = compare_benchmark_results(results, json.load(f), threshold)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    click.echo(get_benchmark_report(results, comparisons))
+    if comparisons and any(c.is_regression for c in comparisons):
+        raise click.exceptions.Exit(1)
+
+
+if __name__ == "__main__":
+    bench()
@@ -1,94 +1,527 @@
+import functools
 import math
-from dataclasses import dataclass, field
+import random
+import time
+from dataclasses import dataclass, field, replace
 from abc import ABC, abstractmethod
-from typing import Optional, Dict
+from typing import Any, List, Optional
 
-from common.model.task import Task, TaskState
+import numpy as np
+
+from common.model.task import ChanceState, Task, TaskState
+from common.model.transposition import TranspositionTable
 
 # TODO: mess around with this
 UCT_C = math.sqrt(2)
+PUCT_C = 1.25
+# With progressive widening, a node with n playouts considers its first 
+# WIDENING_CONSTANT * (n + 1) ** WIDENING_EXPONENT children by prior.
+WIDENING_CONSTANT = 1
+WIDENING_EXPONENT = 0.5
+
+# the index of the root node of every tree
+ROOT = 0
+# marks a node whose children haven't been added yet
+NO_NODE = -1
+# marks a terminal node, which has been expanded but has no children
+NO_CHILDREN = -2
+# the number of nodes a tree has room for at first; the room doubles whenever it runs out
+INITIAL_NODE_CAPACITY = 1024
+# the fraction of a tree's node budget it is pruned down to, so that pruning is rare
+PRUNED_NODE_FRACTION = 0.5
+
+
+def get_selection_values_uct(playout_counts, playout_utility_sums, parent_playout_count):
+    """Produce the UCT value of each of a node's children from their statistics."""
+    return (
+        playout_utility_sums / playout_counts
+        + UCT_C * np.sqrt(math.log(parent_playout_count) / playout_counts)
+    )
 
 
-def get_selection_value_uct(node: "TaskNode"):
-    n = node.playout_count
-    u = node.playout_utility_sum
-    # TODO: is this the correct handling when no parent?
-    parent_n = node.parent.playout_count if node.parent else 0
-    return u / n + UCT_C * math.sqrt(math.log(parent_n) / n)
+def get_selection_values_puct(playout_counts, playout_utility_sums, parent_playout_count, priors, default_utility):
+    """Produce the PUCT value of each of a node's children from their statistics and 
+    prior probabilities.
+
+    Mean utilities are scaled to [0, 1] across the children, so that the weight of the 
+    priors doesn't depend on the scale of utilities; children without playouts are
+    valued at the default utility."""
+    is_played = playout_counts > 0
+    mean_utilities = np.where(
+        is_played, playout_utility_sums / np.maximum(playout_counts, 1), default_utility,
+    )
+    low, high = mean_utilities.min(), mean_utilities.max()
+    scaled_utilities = (mean_utilities - low) / (high - low) if high > low else np.zeros(len(mean_utilities))
+    return scaled_utilities + PUCT_C * priors * math.sqrt(parent_playout_count) / (1 + playout_counts)
+
+
+def get_ranges(starts, counts):
+    """Produce the concatenation of the ranges with the given starts and lengths."""
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
 
 
 @dataclass
-class TaskNode(ABC):
-    state: TaskState
-    # The number of playouts going through this node.
-    playout_count: int = 0
-    # The sum of the utilities of playouts going through this node.
-    playout_utility_sum: float = 0
-    parent: Optional["TaskNode"] = None
-    action_to_child: Dict["Action", "TaskNode"] = field(default_factory=lambda: {})
+class TaskTree(ABC):
+    """A Monte Carlo search tree over the states of a task.
 
-    @property
-    def children(self):
-        return self.action_to_child.values()
+    Nodes are indices into arrays holding each of their values (struct of arrays) rather
+    than objects, so a node takes a few dozen bytes and the values of all children of a
+    node can be operated on at once. The children of a node occupy a contiguous range of
+    nodes, which is added in full the first time the node is expanded; the state of a
+    child is only produced once it is selected.
 
-    @property
-    def possible_actions(self):
-        return self.state.possible_actions
+    Nodes whose state is a ChanceState are chance nodes: their children are keyed by
+    outcome and selection follows the outcome chance picks.
+
+    With a transposition table, nodes reaching the same position (by transposition key)
+    share their statistics through it, so a position reached by another order of 
+    actions starts out with what is known about it."""
+    root_state: TaskState
+    transposition_table: Optional[TranspositionTable] = None
+    # the most nodes the tree keeps; once a search passes it, the tree is pruned (see 
+    # prune). None for no limit.
+    max_node_count: Optional[int] = None
+    # Whether to select the children of decision nodes by PUCT with the priors of 
+    # get_action_priors rather than by the get_selection_values given to mcts. Children 
+    # are then ordered by prior, and with progressive widening (a widening exponent) only
+    # the first few are considered until the node has more playouts.
+    use_priors: bool = False
+    widening_exponent: Optional[float] = WIDENING_EXPONENT
+    # The number of playouts going through each node.
+    playout_counts: np.ndarray = field(init=False)
+    # The sum of the utilities of playouts going through each node.
+    playout_utility_sums: np.ndarray = field(init=False)
+    parents: np.ndarray = field(init=False)
+    first_children: np.ndarray = field(init=False)
+    child_counts: np.ndarray = field(init=False)
+    is_chance: np.ndarray = field(init=False)
+    # The prior probability of each node's action being its parent's best (see 
+    # get_action_priors); only set for the children of decision nodes if use_priors is set.
+    priors: np.ndarray = field(init=False)
+    # The action (or outcome) leading from the parent to each node.
+    actions: List[Any] = field(init=False)
+    # The state of each node, or None until the node is first selected.
+    states: List[Any] = field(init=False)
+    node_count: int = field(init=False)
+    # The number of iterations searched since the tree was created or re-rooted.
+    iteration_count: int = field(init=False)
+
+    def __post_init__(self):
+        self._allocate_arrays(INITIAL_NODE_CAPACITY)
+        self.actions = [None]
+        self.states = [self.root_state]
+        self.node_count = 1
+        self.iteration_count = 0
+        self.is_chance[ROOT] = isinstance(self.root_state, ChanceState)
+
+    def _allocate_arrays(self, capacity):
+        self.playout_counts = np.zeros(capacity, dtype=np.int32)
+        self.playout_utility_sums = np.zeros(capacity)
+        self.parents = np.full(capacity, NO_NODE, dtype=np.int32)
+        self.first_children = np.full(capacity, NO_NODE, dtype=np.int32)
+        self.child_counts = np.zeros(capacity, dtype=np.int32)
+        self.is_chance = np.zeros(capacity, dtype=bool)
+        self.priors = np.zeros(capacity)
 
     @property
-    def explored_actions(self):
-        return self.action_to_child.keys()
+    def _arrays(self):
+        return (
+            self.playout_counts, self.playout_utility_sums, self.parents,
+            self.first_children, self.child_counts, self.is_chance, self.priors,
+        )
 
     @property
-    def unexplored_actions(self):
-        explored_actions = set(self.explored_actions)
-        return [a for a in self.possible_actions if a not in explored_actions]
-
-    def select(self, get_value):
-        # if we don't have a child for every possible action, select this node
-        if not self.possible_actions or len(self.explored_actions) < len(self.possible_actions):
-            return self
-        else:
-            return max(self.children, key=get_value).select(get_value)
+    def capacity(self):
+        return len(self.playout_counts)
+
+    def _get_capacity(self, capacity):
+        # a tree may pass its node budget by the nodes added in one iteration
+        if self.max_node_count is not None:
+            return min(capacity, max(2 * self.max_node_count, INITIAL_NODE_CAPACITY))
+        return capacity
+
+    def _add_nodes(self, count):
+        """Add nodes, producing the index of the first one."""
+        first = self.node_count
+        if first + count > self.capacity:
+            old_arrays = self._arrays
+            self._allocate_arrays(max(self._get_capacity(2 * self.capacity), first + count))
+            for array, old_array in zip(self._arrays, old_arrays):
+                array[:first] = old_array[:first]
+        self.node_count += count
+        return first
 
-    def back_propagate(self, playout_utility):
-        self.playout_count += 1
-        self.playout_utility_sum += playout_utility
+    def get_children(self, node):
+        first = self.first_children[node]
+        return range(first, first + self.child_counts[node]) if first != NO_NODE else range(0)
 
-        if self.parent:
-            self.parent.back_propagate(playout_utility)
+    def perform_action(self, state, action):
+        """Produce the state of the child reached by an action.
+
+        Tasks with chance events produce the afterstate here, so that the chance event
+        gets a node of its own."""
+        return state.perform_action(action)
 
     @abstractmethod
-    def expand(self):
-        """Add a child node."""
+    def simulate(self, state, max_playout_depth=None):
+        """Run a semi-random playout from a state, returning a number
+        indicating how successful the playout was."""
         pass
 
-    @abstractmethod
-    def simulate(self):
-        """Run a semi-random playout from the current state, returning a number
-        indicating how successful the playout was.
+    def simulate_with_playout_length(self, state, max_playout_depth=None):
+        """Run a playout as simulate does, producing its utility and its number of 
+        actions, or None if the tree doesn't know it."""
+        return self.simulate(state, max_playout_depth=max_playout_depth), None
 
-        Do not store the resulting playout tree."""
-        pass
+    def get_action_priors(self, state, actions):
+        """Produce the prior probability of each of a state's actions being the best, used
+        if use_priors is set; uniform unless overridden."""
+        return np.full(len(actions), 1 / len(actions))
+
+    def _expand(self, node):
+        """Add a child for every action (or outcome) of a node."""
+        state = self.states[node]
+        actions = state.possible_outcomes if self.is_chance[node] else state.possible_actions
+        first = self._add_nodes(len(actions))
+        if self.use_priors and actions and not self.is_chance[node]:
+            priors = self.get_action_priors(state, actions)
+            order = np.argsort(-priors, kind="stable")
+            actions = [actions[i] for i in order.tolist()]
+            self.priors[first:first + len(actions)] = priors[order]
+        self.parents[first:first + len(actions)] = node
+        self.first_children[node] = first if actions else NO_CHILDREN
+        self.child_counts[node] = len(actions)
+        self.actions.extend(actions)
+        self.states.extend([None] * len(actions))
+
+    def _select_child(self, node, get_selection_values):
+        first = int(self.first_children[node])
+        end = first + int(self.child_counts[node])
+
+        if self.is_chance[node]:
+            # follow the outcome chance picks
+            state = self.states[node]
+            child = self.actions.index(state.sample_outcome(), first, end)
+        elif self.use_priors:
+            parent_playout_count = int(self.playout_counts[node])
+            if self.widening_exponent is not None:
+                end = min(end, first + math.ceil(WIDENING_CONSTANT * (parent_playout_count + 1) ** self.widening_exponent))
+            child = first + int(get_selection_values_puct(
+                self.playout_counts[first:end],
+                self.playout_utility_sums[first:end],
+                parent_playout_count,
+                self.priors[first:end],
+                self.playout_utility_sums[node] / parent_playout_count if parent_playout_count else 0,
+            ).argmax())
+        else:
+            playout_counts = self.playout_counts[first:end]
+            if not playout_counts.all():
+                # random to avoid getting stuck with the worst action when utility is tied
+                child = first + int(random.choice((playout_counts == 0).nonzero()[0]))
+            else:
+                child = first + int(get_selection_values(
+                    playout_counts,
+                    self.playout_utility_sums[first:end],
+                    self.playout_counts[node],
+                ).argmax())
+
+        if self.states[child] is None:
+            self._create_child_state(node, child)
+        return child
+
+    def _create_child_state(self, node, child):
+        """Produce the state of a child from its parent's state and its action, the first
+        time it is selected or once it was dropped by prune."""
+        state = self.states[node]
+        action = self.actions[child]
+        child_state = state.resolve(action) if self.is_chance[node] else self.perform_action(state, action)
+        self.states[child] = child_state
+        self.is_chance[child] = isinstance(child_state, ChanceState)
+        # a child whose state was dropped keeps its own statistics
+        if self.transposition_table is not None and not self.playout_counts[child]:
+            key = child_state.transposition_key
+            entry = self.transposition_table.get(key) if key is not None else None
+            if entry is not None:
+                self.playout_counts[child], self.playout_utility_sums[child] = entry
+
+    def _select(self, get_selection_values):
+        """Descend from the root to a node to simulate, producing the path to it.
+
+        This is the first decision node reached that has never been played, or a
+        terminal node; chance nodes are passed through."""
+        node = ROOT
+        path = [node]
+        while True:
+            if node != ROOT and not self.is_chance[node] and not self.playout_counts[node]:
+                return path
+            if self.first_children[node] == NO_NODE:
+                self._expand(node)
+            if not self.child_counts[node]:
+                # impossible to expand a terminal node; no possible actions
+                return path
+            node = self._select_child(node, get_selection_values)
+            path.append(node)
+
+    def _back_propagate(self, path, playout_utility):
+        path = np.array(path)
+        self.playout_counts[path] += 1
+        self.playout_utility_sums[path] += playout_utility
+
+        if self.transposition_table is not None:
+            for node in path.tolist():
+                key = self.states[node].transposition_key
+                if key is None:
+                    continue
+                playout_count, playout_utility_sum = self.transposition_table.add_playout(key, playout_utility)
+                # a node keeps its own statistics if its position was evicted since
+                if playout_count > self.playout_counts[node]:
+                    self.playout_counts[node] = playout_count
+                    self.playout_utility_sums[node] = playout_utility_sum
+
+    def _iterate(self, get_selection_values, max_playout_depth):
+        """Run an iteration of the search, producing the path it took, or None if the
+        root is terminal."""
+        path = self._select(get_selection_values)
+        if len(path) == 1:
+            return None
+        self._back_propagate(path, self.simulate(self.states[path[-1]], max_playout_depth=max_playout_depth))
+        return path
+
+    def _iterate_with_stats(self, stats, get_selection_values, max_playout_depth):
+        """Run an iteration as _iterate does, adding the time each phase takes to stats."""
+        start = time.perf_counter()
+        path = self._select(get_selection_values)
+        selected_at = time.perf_counter()
+        if len(path) == 1:
+            return None
+        utility, playout_length = self.simulate_with_playout_length(
+            self.states[path[-1]], max_playout_depth=max_playout_depth,
+        )
+        simulated_at = time.perf_counter()
+        self._back_propagate(path, utility)
+        stats.add_iteration(
+            path, 
+            selected_at - start, 
+            simulated_at - selected_at, 
+            time.perf_counter() - simulated_at,
+            playout_length,
+        )
+        return path
+
+    def get_node_depths(self):
+        """Produce the depth of every node, the root being at depth 0."""
+        depths = np.zeros(self.node_count, dtype=np.int32)
+        level = np.array([ROOT])
+        depth = 0
+        while level.size:
+            depths[level] = depth
+            level = level[self.first_children[level] != NO_NODE]
+            level = get_ranges(self.first_children[level], self.child_counts[level])
+            depth += 1
+        return depths
+
+    def _get_most_played_child(self):
+        children = self.get_children(ROOT)
+        if not children:
+            return None
+        return children.start + int(self.playout_counts[children.start:children.stop].argmax())
+
+    def get_most_played_action(self):
+        child = self._get_most_played_child()
+        return self.actions[child] if child is not None else None
+
+    def get_subtree_for_state(self, state):
+        """Produce a tree rooted at the node following the root whose state is equivalent
+        to the given one, with the statistics of its subtree, if there is such a node.
+
+        Chance nodes are looked through, since they have no decision to make."""
+        for child in self.get_children(ROOT):
+            nodes = self.get_children(child) if self.is_chance[child] else (child,)
+            for node in nodes:
+                node_state = self.states[node]
+                if node_state is not None and node_state.is_equivalent(state):
+                    return self._copy_subtree(node)
+        return None
+
+    def _get_subtree_nodes(self, root, cut=None):
+        """Produce the nodes of a subtree a level at a time, so the children of each node 
+        stay contiguous, leaving out the descendants of the nodes marked in cut."""
+        levels = []
+        level = np.array([root])
+        while level.size:
+            levels.append(level)
+            is_expanded = self.first_children[level] != NO_NODE
+            if cut is not None:
+                is_expanded &= ~cut[level]
+            level = level[is_expanded]
+            level = get_ranges(self.first_children[level], self.child_counts[level])
+        return np.concatenate(levels)
+
+    def _set_nodes(self, source, nodes, cut=None):
+        """Make this tree's nodes copies of the given nodes of a source tree, which may be 
+        this tree, with the nodes marked in cut left without children."""
+        new_indices = np.full(source.node_count, NO_NODE, dtype=np.int32)
+        new_indices[nodes] = np.arange(len(nodes))
+
+        # everything is read from the source before this tree's arrays are replaced
+        playout_counts = source.playout_counts[nodes]
+        playout_utility_sums = source.playout_utility_sums[nodes]
+        is_chance = source.is_chance[nodes]
+        priors = source.priors[nodes]
+        first_children = source.first_children[nodes]
+        child_counts = source.child_counts[nodes]
+        if cut is not None:
+            is_cut = cut[nodes]
+            first_children[is_cut] = NO_NODE
+            child_counts[is_cut] = 0
+        parents = new_indices[source.parents[nodes[1:]]]
+        actions = [source.actions[n] for n in nodes.tolist()]
+        states = [source.states[n] for n in nodes.tolist()]
+
+        self._allocate_arrays(max(self._get_capacity(max(INITIAL_NODE_CAPACITY, 2 * len(nodes))), len(nodes)))
+        self.node_count = len(nodes)
+        self.playout_counts[:len(nodes)] = playout_counts
+        self.playout_utility_sums[:len(nodes)] = playout_utility_sums
+        self.is_chance[:len(nodes)] = is_chance
+        self.priors[:len(nodes)] = priors
+        # only nodes with children are renumbered; the others keep NO_NODE or NO_CHILDREN
+        has_children = child_counts > 0
+        first_children[has_children] = new_indices[first_children[has_children]]
+        self.first_children[:len(nodes)] = first_children
+        self.child_counts[:len(nodes)] = child_counts
+        self.parents[1:len(nodes)] = parents
+        self.actions = actions
+        self.states = states
+
+    def _copy_subtree(self, root):
+        tree = replace(self, root_state=self.states[root])
+        tree._set_nodes(self, self._get_subtree_nodes(root))
+        tree.actions[ROOT] = None
+        return tree
+
+    def _get_kept_node_count(self, levels, cut):
+        """Produce the number of nodes left if the descendants of the nodes marked in cut 
+        were pruned."""
+        is_kept = np.zeros(self.node_count, dtype=bool)
+        is_kept[ROOT] = True
+        for level in levels[1:]:
+            parents = self.parents[level]
+            is_kept[level] = is_kept[parents] & ~cut[parents]
+        return int(is_kept.sum())
+
+    def prune(self, max_node_count):
+        """Prune the subtrees of the least played nodes until at most max_node_count nodes
+        are left (or only the root and its children), then drop the states of the nodes
+        left without children below the grandchildren of the root, which 
+        get_subtree_for_state looks through to re-root the tree.
+
+        Pruned nodes keep their statistics and are expanded again if they are selected; 
+        nodes without states produce them again from their parent's state and action."""
+        node_count = self.node_count
+        depths = self.get_node_depths()
+        levels = [np.flatnonzero(depths == d) for d in range(int(depths.max()) + 1)]
+        playout_counts = self.playout_counts[:node_count]
+        is_expandable = self.child_counts[:node_count] > 0
+        is_expandable[ROOT] = False
+
+        # a node is cut if it has at most a threshold of playouts; the threshold is the 
+        # least of the candidates that leaves few enough nodes
+        thresholds = np.unique(playout_counts[is_expandable])
+        low, high = 0, len(thresholds)
+        while low < high:
+            middle = (low + high) // 2
+            cut = is_expandable & (playout_counts <= thresholds[middle])
+            if self._get_kept_node_count(levels, cut) <= max_node_count:
+                high = middle
+            else:
+                low = middle + 1
+        cut = is_expandable & (playout_counts <= thresholds[min(low, len(thresholds) - 1)]) if len(thresholds) else None
+
+        self._set_nodes(self, self._get_subtree_nodes(ROOT, cut), cut)
+
+        depths = self.get_node_depths()
+        for node in np.flatnonzero(
+            (depths >= 3) & (self.first_children[:self.node_count] == NO_NODE) & ~self.is_chance[:self.node_count]
+        ).tolist():
+            self.states[node] = None
 
     def mcts(
         self,
-        task: Task, 
-        get_node_selection_value=get_selection_value_uct,
+        task: Task,
+        get_selection_values=get_selection_values_uct,
         max_playout_depth=None,
+        emit_only_on_change=True,
+        min_emission_interval_sec=None,
+        stats=None,
+    ):
+        """Run the Monte Carlo Tree Search algorithm to determine the best action
+        at the root's state, yielding the best action so far (the most played one) as
+        the search goes on. The last action yielded is the best one once the search ends.
+
+        :param get_selection_values: A function used to determine the value of each
+        of a node's children in the selection phase of the algorithm, given their
+        playout counts and utility sums and the node's playout count.
+        :param emit_only_on_change: Whether to yield only when the best action changes
+        rather than after every iteration.
+        :param min_emission_interval_sec: The least time between yields when only 
+        yielding on change; a change within it is yielded once it has passed.
+        :param stats: MctsSearchStats to record the search in, if given."""
+        if stats is None:
+            yield from self._mcts(
+                task, self._iterate, get_selection_values, max_playout_depth, 
+                emit_only_on_change, min_emission_interval_sec,
+            )
+            return
+
+        stats.start(self)
+        try:
+            yield from self._mcts(
+                task, functools.partial(self._iterate_with_stats, stats), get_selection_values, 
+                max_playout_depth, emit_only_on_change, min_emission_interval_sec,
+            )
+        finally:
+            stats.end(self)
+
+    def _mcts(
+        self, 
+        task, 
+        iterate, 
+        get_selection_values, 
+        max_playout_depth, 
+        emit_only_on_change, 
+        min_emission_interval_sec,
     ):
-        """Run the Monte Carlo Tree Search algorithm to determine the best action 
-        at a given state.
+        best_child = self._get_most_played_child()
+        emitted_child = None
+        emitted_at = None
 
-        :param get_node_selection_value: A function used to determine the value 
-        of a node in the selection phase of the algorithm."""
         while task.time_remaining:
-            selected_node = self.select(get_node_selection_value)
-            if not selected_node.possible_actions:
-                # impossible to expand a terminal node; no possible actions
+            path = iterate(get_selection_values, max_playout_depth)
+            if path is None:
+                # the root is terminal
                 break
-            else:
-                child = selected_node.expand()
-                child.back_propagate(child.simulate(max_playout_depth=max_playout_depth))
-                # at each iteration we yield the best action so far
-                yield max(self.action_to_child.items(), key=lambda e: e[1].playout_count)[0]
+            self.iteration_count += 1
+            if self.max_node_count is not None and self.node_count > self.max_node_count:
+                # pruning renumbers nodes, but the root's children stay where they are
+                self.prune(int(self.max_node_count * PRUNED_NODE_FRACTION))
+
+            # only the root's child on the path has gained playouts, so it is the only 
+            # one that can have become the most played
+            child = path[1]
+            if best_child is None or self.playout_counts[child] > self.playout_counts[best_child]:
+                best_child = child
+
+            if not emit_only_on_change:
+                yield self.actions[best_child]
+            elif best_child != emitted_child and (
+                min_emission_interval_sec is None
+                or emitted_at is None
+                or time.monotonic() - emitted_at >= min_emission_interval_sec
+            ):
+                emitted_child = best_child
+                emitted_at = time.monotonic() if min_emission_interval_sec is not None else None
+                yield self.actions[best_child]
+
+        if emit_only_on_change and best_child is not None and best_child != emitted_child:
+            yield self.actions[best_child]
@@ -0,0 +1,114 @@
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+from common.model.mcts import ROOT
+
+
+@dataclass
+class MctsSearchStats:
+    """Statistics of one search of a tree (see TaskTree.mcts): where its time went and
+    the shape of the tree it left.
+
+    Times are in seconds. Expanding covers adding children and producing the state of
+    a child when it is first selected; selecting covers the rest of the descent."""
+    iteration_count: int = 0
+    select_sec: float = 0.0
+    expand_sec: float = 0.0
+    simulate_sec: float = 0.0
+    back_propagate_sec: float = 0.0
+    # the number of iterations whose path had each length, in nodes below the root
+    path_length_counts: Counter = field(default_factory=Counter)
+    # the number of playouts of each length in actions, for trees that report it
+    playout_length_counts: Counter = field(default_factory=Counter)
+    # filled in once the search ends
+    wall_sec: Optional[float] = None
+    node_count: Optional[int] = None
+    played_node_count: Optional[int] = None
+    max_depth: Optional[int] = None
+    mean_depth: Optional[float] = None
+    # (action, playout count, mean utility) of each child of the root
+    root_visits: Optional[list] = None
+    started_at: Optional[float] = None
+
+    def _time(self, phase, method):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                setattr(self, phase, getattr(self, phase) + time.perf_counter() - start)
+        return timed
+
+    def start(self, tree):
+        """Time the expansion of a tree until end is called.
+
+        The tree's methods are wrapped for the duration of the search rather than
+        checking for stats in them, so a search without stats runs as it always has."""
+        self.started_at = time.perf_counter()
+        tree._expand = self._time("expand_sec", tree._expand)
+        tree._create_child_state = self._time("expand_sec", tree._create_child_state)
+
+    def add_iteration(self, path, select_sec, simulate_sec, back_propagate_sec, playout_length):
+        """Add an iteration, whose select time includes the time spent expanding."""
+        self.iteration_count += 1
+        self.select_sec += select_sec
+        self.simulate_sec += simulate_sec
+        self.back_propagate_sec += back_propagate_sec
+        self.path_length_counts[len(path) - 1] += 1
+        if playout_length is not None:
+            self.playout_length_counts[playout_length] += 1
+
+    def end(self, tree):
+        """Stop timing a tree and record its shape."""
+        del tree._expand
+        del tree._create_child_state
+        # the time spent expanding was counted as selecting too
+        self.select_sec -= self.expand_sec
+        self.wall_sec = time.perf_counter() - self.started_at
+
+        depths = tree.get_node_depths()
+        played_depths = depths[tree.playout_counts[:tree.node_count] > 0]
+        self.node_count = tree.node_count
+        self.played_node_count = len(played_depths)
+        self.max_depth = int(played_depths.max()) if len(played_depths) else 0
+        self.mean_depth = float(played_depths.mean()) if len(played_depths) else 0.0
+
+        children = tree.get_children(ROOT)
+        self.root_visits = [
+            (
+                tree.actions[child],
+                int(tree.playout_counts[child]),
+                float(tree.playout_utility_sums[child] / tree.playout_counts[child])
+                if tree.playout_counts[child] else None,
+            )
+            for child in children
+        ]
+
+    def to_record(self, format_action=str):
+        """Produce a JSON-ready dict of the statistics."""
+        playout_lengths = list(self.playout_length_counts.elements())
+        path_lengths = list(self.path_length_counts.elements())
+        return dict(
+            iteration_count=self.iteration_count,
+            wall_sec=self.wall_sec,
+            select_sec=self.select_sec,
+            expand_sec=self.expand_sec,
+            simulate_sec=self.simulate_sec,
+            back_propagate_sec=self.back_propagate_sec,
+            node_count=self.node_count,
+            played_node_count=self.played_node_count,
+            max_depth=self.max_depth,
+            mean_depth=self.mean_depth,
+            path_length_mean=float(np.mean(path_lengths)) if path_lengths else None,
+            playout_length_mean=float(np.mean(playout_lengths)) if playout_lengths else None,
+            playout_length_max=max(playout_lengths) if playout_lengths else None,
+            playout_length_counts={str(k): v for k, v in sorted(self.playout_length_counts.items())},
+            root_visits=[
+                dict(action=format_action(action), playout_count=playout_count, mean_utility=mean_utility)
+                for action, playout_count, mean_utility in sorted(self.root_visits or (), key=lambda v: -v[1])
+            ],
+        )
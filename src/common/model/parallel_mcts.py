@@ -0,0 +1,235 @@
+import math
+import multiprocessing
+import multiprocessing.connection
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Set
+
+from common.model.mcts import ROOT
+from common.model.mcts_stats import MctsSearchStats
+from common.model.task import DeadlineTask, Task
+
+# How often workers report the statistics of the root's children, in seconds.
+MERGE_INTERVAL_SEC = 0.1
+
+# Workers are spawned rather than forked since the parent runs Rx and pygame threads.
+_mp_context = multiprocessing.get_context("spawn")
+
+
+@dataclass
+class ConnectionTask(Task):
+    """A task that lasts until a message arrives on a connection."""
+    conn: Any
+
+    @property
+    def time_remaining(self):
+        return not self.conn.poll()
+
+
+def get_root_stats(tree):
+    """Produce the playout count and utility sum of each played child of a tree's root by action."""
+    return {
+        tree.actions[child]: (int(tree.playout_counts[child]), float(tree.playout_utility_sums[child]))
+        for child in tree.get_children(ROOT)
+        if tree.playout_counts[child]
+    }
+
+
+def merge_root_stats(root_stats):
+    """Sum the statistics of the root's children across searches."""
+    merged_stats = {}
+    for stats in root_stats:
+        for action, (playout_count, playout_utility_sum) in stats.items():
+            merged_count, merged_utility_sum = merged_stats.get(action, (0, 0))
+            merged_stats[action] = (merged_count + playout_count, merged_utility_sum + playout_utility_sum)
+    return merged_stats
+
+
+def get_most_played_action(root_stats):
+    return max(root_stats.items(), key=lambda e: e[1][0])[0] if root_stats else None
+
+
+def _run_search_worker(conn, merge_interval):
+    """Run searches sent over a connection until told to close, after sending a message
+    once ready for the first one.
+
+    While searching, the statistics of the root's children and the number of iterations
+    so far are sent back periodically and when the search ends, either by a stop message
+    or by running out of actions. The search's MctsSearchStats are sent when it ends, 
+    if they were asked for.
+
+    If the state of a search was reached from the previous search's root, the search 
+    continues from that subtree; otherwise it still keeps the previous transposition table."""
+    previous_tree = None
+    conn.send(None)
+
+    while True:
+        command, *args = conn.recv()
+
+        if command == "close":
+            return
+        elif command == "search":
+            tree, seed, max_playout_depth, collect_stats = args
+            stats = MctsSearchStats() if collect_stats else None
+            random.seed(seed)
+
+            if previous_tree:
+                subtree = previous_tree.get_subtree_for_state(tree.root_state)
+                if subtree:
+                    tree = subtree
+                elif tree.transposition_table is not None:
+                    # what was learned about positions still applies to a new tree
+                    tree.transposition_table = previous_tree.transposition_table
+            previous_tree = tree
+
+            reported_at = time.monotonic()
+            start_iteration_count = tree.iteration_count
+            # every iteration is yielded, so the statistics are sent on time
+            moves = tree.mcts(
+                ConnectionTask(conn), max_playout_depth=max_playout_depth, emit_only_on_change=False, stats=stats,
+            )
+            for _ in moves:
+                now = time.monotonic()
+                if now - reported_at >= merge_interval:
+                    conn.send((False, get_root_stats(tree), tree.iteration_count - start_iteration_count, None))
+                    reported_at = now
+
+            conn.send((True, get_root_stats(tree), tree.iteration_count - start_iteration_count, stats))
+        # a stop message for a search that already ended needs no reply
+
+
+@dataclass
+class MctsWorkerPool:
+    """Worker processes that each search the same root with their own random seed,
+    merging the statistics of the root's children (root parallelization).
+
+    The processes are started by start, or else with the first search, and reused for 
+    later ones."""
+    worker_count: int
+    merge_interval: float = MERGE_INTERVAL_SEC
+    connections: List[Any] = field(default_factory=list)
+    # the connections of workers that haven't finished the current search
+    searching: Set[Any] = field(default_factory=set)
+    # identifies the current search, so an abandoned search can't interfere with a newer one
+    search_token: Any = None
+    # the number of iterations each worker last reported for the current or last search
+    iteration_count_by_conn: Dict[Any, int] = field(default_factory=dict)
+    # the MctsSearchStats of each worker that finished the last search, if asked for
+    search_stats_by_conn: Dict[Any, MctsSearchStats] = field(default_factory=dict)
+    lock: Any = field(default_factory=threading.Lock)
+
+    @property
+    def iteration_count(self):
+        """Produce the number of iterations of the current or last search across workers."""
+        return sum(self.iteration_count_by_conn.values())
+
+    def _start(self):
+        for _ in range(self.worker_count):
+            conn, worker_conn = _mp_context.Pipe()
+            _mp_context.Process(
+                target=_run_search_worker,
+                args=(worker_conn, self.merge_interval),
+                daemon=True,
+            ).start()
+            self.connections.append(conn)
+        # spawned workers take a while to import everything, which would come out of the 
+        # first search's time
+        for conn in self.connections:
+            conn.recv()
+
+    def start(self):
+        """Start the worker processes and wait until they are ready, if they aren't running."""
+        with self.lock:
+            if not self.connections:
+                self._start()
+
+    def _receive(self, timeout=None):
+        """Produce the statistics sent by workers that are ready within the timeout by worker."""
+        stats_by_conn = {}
+        for conn in multiprocessing.connection.wait(list(self.searching), timeout=timeout):
+            is_done, stats_by_conn[conn], self.iteration_count_by_conn[conn], search_stats = conn.recv()
+            if is_done:
+                self.searching.remove(conn)
+                if search_stats is not None:
+                    self.search_stats_by_conn[conn] = search_stats
+        return stats_by_conn
+
+    def _stop_search(self):
+        """Stop the current search, producing the final statistics of the workers that
+        were still searching by worker."""
+        for conn in self.searching:
+            conn.send(("stop",))
+        # wait for every worker to finish so the next search starts cleanly
+        stats_by_conn = {}
+        while self.searching:
+            stats_by_conn.update(self._receive())
+        self.search_token = None
+        return stats_by_conn
+
+    def close(self):
+        with self.lock:
+            self._stop_search()
+            for conn in self.connections:
+                conn.send(("close",))
+            self.connections.clear()
+
+    def mcts(self, tree, task: Task, max_playout_depth=None, collect_stats=False):
+        """Run the Monte Carlo Tree Search algorithm in every worker on a tree to determine
+        the best action at the root's state, yielding the most played action across all workers
+        whenever it changes as their statistics are merged. The last action yielded is the
+        best one once the search ends; an action is always yielded if the root has any.
+
+        If collect_stats is set, each worker's MctsSearchStats are kept in 
+        search_stats_by_conn once the search ends."""
+        search_token = object()
+
+        with self.lock:
+            if not self.connections:
+                self._start()
+            # a search whose consumer stopped iterating may not have been closed yet
+            self._stop_search()
+
+            for conn in self.connections:
+                conn.send(("search", tree, random.getrandbits(32), max_playout_depth, collect_stats))
+            self.searching.update(self.connections)
+            self.search_token = search_token
+            self.iteration_count_by_conn = {}
+            self.search_stats_by_conn = {}
+
+        stats_by_conn = {}
+        emitted_action = None
+        try:
+            while task.time_remaining:
+                with self.lock:
+                    if self.search_token is not search_token or not self.searching:
+                        break
+                    new_stats_by_conn = self._receive(timeout=(
+                        self.merge_interval if task.time_remaining_sec is None
+                        else min(self.merge_interval, task.time_remaining_sec)
+                    ))
+
+                if new_stats_by_conn:
+                    stats_by_conn.update(new_stats_by_conn)
+                    action = get_most_played_action(merge_root_stats(stats_by_conn.values()))
+                    if action is not None and action != emitted_action:
+                        emitted_action = action
+                        yield action
+
+            # the workers' final statistics include what they searched since their last report
+            with self.lock:
+                if self.search_token is search_token:
+                    stats_by_conn.update(self._stop_search())
+            action = get_most_played_action(merge_root_stats(stats_by_conn.values()))
+            if action is None:
+                # no worker got through an iteration in time; one here still picks a move
+                action = next(tree.mcts(
+                    DeadlineTask(math.inf), max_playout_depth=max_playout_depth, emit_only_on_change=False,
+                ), None)
+            if action is not None and action != emitted_action:
+                yield action
+        finally:
+            with self.lock:
+                if self.search_token is search_token:
+                    self._stop_search()
@@ -1,9 +1,8 @@
 import random
+import time
 from dataclasses import dataclass
 from abc import ABC, abstractproperty, abstractmethod
 
-from common.util.iter import group
-
 
 @dataclass
 class Task(ABC):
@@ -11,6 +10,27 @@ class Task(ABC):
     def time_remaining(self):
         pass
 
+    @property
+    def time_remaining_sec(self):
+        """The time left in seconds, or None if the task can't tell."""
+        return None
+
+
+@dataclass
+class DeadlineTask(Task):
+    """A task that lasts until a deadline in the time.monotonic clock.
+
+    Checking the time remaining only reads the clock, so it can be done every iteration."""
+    deadline: float
+
+    @property
+    def time_remaining(self):
+        return time.monotonic() < self.deadline
+
+    @property
+    def time_remaining_sec(self):
+        return max(self.deadline - time.monotonic(), 0)
+
 
 @dataclass
 class TaskState(ABC):
@@ -22,25 +42,42 @@ class TaskState(ABC):
     def perform_action(self, action):
         pass
 
+    def is_equivalent(self, other):
+        """Determine whether another state can be searched in place of this one."""
+        return self == other
+
+    @property
+    def transposition_key(self):
+        """A hashable key shared by equivalent states, or None if states can't be 
+        matched up this way."""
+        return None
+
+
+@dataclass
+class ChanceState(ABC):
+    """A state where chance rather than an action decides the next state."""
+
+    @property
+    def transposition_key(self):
+        return None
+
+    @abstractproperty
+    def outcome_probabilities(self):
+        """A dict of the probability of each possible outcome."""
+        pass
+
+    @abstractmethod
+    def resolve(self, outcome):
+        """Produce the state following an outcome."""
+        pass
+
+    @property
+    def possible_outcomes(self):
+        return list(self.outcome_probabilities)
 
-def create_select_action_by_utility(get_utility):
-    """Given a state utility estimator function, create a function that 
-    selects the best move given a state and possible moves.
-    
-    If there is a tie, select one of the tied actions at random."""
-
-    def select_move_by_utility(state, possible_actions):
-        return random.choice(
-            max(
-                group(
-                    [
-                        (action, get_utility(state.perform_action(action)))
-                        for action in possible_actions
-                    ], 
-                    get_key=lambda item: item[1],  # group actions by utility
-                ).items(),
-                key=lambda item: item[0],  # get the group with the best utility
-            )[1]  # pick a random action from that group
-        )[0] if possible_actions else None
-    
-    return select_move_by_utility
\ No newline at end of file
+    def sample_outcome(self, outcomes=None):
+        """Pick an outcome at random according to its probability, optionally from a subset."""
+        probabilities = self.outcome_probabilities
+        if outcomes is None:
+            outcomes = list(probabilities)
+        return random.choices(outcomes, weights=[probabilities[o] for o in outcomes])[0]
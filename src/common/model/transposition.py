@@ -0,0 +1,38 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+# The most positions a transposition table holds by default; each takes about 200 bytes.
+TRANSPOSITION_TABLE_SIZE = 100_000
+
+
+@dataclass
+class TranspositionTable:
+    """The playout statistics of positions, shared by every search tree node that
+    reaches the same position.
+
+    Once full, the least recently used position is evicted for each new one, so a
+    table never holds more than max_size positions."""
+    max_size: int = TRANSPOSITION_TABLE_SIZE
+    # [playout count, playout utility sum] by transposition key, least recently used first
+    entries: OrderedDict = field(default_factory=OrderedDict)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Produce the statistics of a position, or None if they aren't in the table."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def add_playout(self, key, playout_utility):
+        """Count a playout through a position, producing its updated statistics."""
+        entry = self.get(key)
+        if entry is None:
+            if len(self.entries) >= self.max_size:
+                self.entries.popitem(last=False)
+            entry = self.entries[key] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += playout_utility
+        return entry
@@ -1,13 +1,19 @@
 import json
+import math
+
 import numpy as np
 
 
-def arr_get_safe(arr, idx, default=None):
-    """Get a value from a numpy.array, or return a default if out of bounds."""
-    try:
-        return arr.item(idx)
-    except IndexError:
-        return default
+def get_mean_and_standard_error(values):
+    """Produce the mean of a sample and the standard error of that mean."""
+    mean = float(np.mean(values))
+    return mean, float(np.std(values, ddof=1) / math.sqrt(len(values))) if len(values) > 1 else 0.0
+
+
+def get_softmax(values, temperature=1):
+    """Produce probabilities proportional to the exponentials of values over a temperature."""
+    exponentials = np.exp((values - np.max(values)) / temperature)
+    return exponentials / exponentials.sum()
 
 
 class NumpyJsonEncoder(json.JSONEncoder):
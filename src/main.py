@@ -1,43 +1,76 @@
+import json
+
 import click
 from rx.subject import Subject
 
 from common.util.concurrency import rx_background_scheduler
-from tetris.model.strategy import select_move_random, select_move_smart, get_complex_utility
-from tetris.model.gameplay.player.simple import SimplePlayer
-from tetris.model.gameplay.player.mcts import MctsPlayer
 from tetris.model.gameplay.player.interactive import InteractivePlayer
+from tetris.model.gameplay.selfplay import MCTS_SELECTIONS, create_computer_player
 from tetris.model.gameplay.common.conductor import GameConductor
+from tetris.model.gameplay.recording import GameRecorder
 from tetris.ui.game import GameDisplay, pygame_session
 
 
 @click.command()
 @click.option("--player-type", type=click.Choice(["interactive", "simple", "mcts"]), default="interactive", help="The type of player to use; interactive lets you play.")
 @click.option("--max-turn-duration", default=300, help="Maximum duration of each turn in seconds.")
+@click.option("--turn-budget-ms", default=None, type=int, help="Maximum duration of each turn in milliseconds; overrides --max-turn-duration.")
 @click.option("--mcts-playout-policy", type=click.Choice(["random", "smart"]), default="smart", help="The manner of selecting moves during MCTS playout.")
 @click.option("--mcts-playout-depth", default=10, help="Max playout depth.")
-def run_game(player_type, max_turn_duration, mcts_playout_policy, mcts_playout_depth):
+@click.option("--mcts-workers", default=1, help="Number of processes searching each turn in parallel; 1 searches in the game process.")
+@click.option("--mcts-max-nodes", default=None, type=int, help="Most nodes kept in each search tree; the least played subtrees are pruned past it.")
+@click.option("--mcts-selection", type=click.Choice(MCTS_SELECTIONS), default="uct", help="UCT, or PUCT with priors from the utilities of the boards after each move and progressive widening.")
+@click.option("--seed", default=None, type=click.IntRange(-2 ** 63, 2 ** 63 - 1), help="Seed of the random pieces.")
+@click.option("--record", default=None, help="Output file for a binary recording of the game, which replay.py can verify.")
+@click.option("--mcts-stats", default=None, help="Output file for statistics of each turn's search in JSONL format; for the mcts player.")
+def run_game(
+    player_type, max_turn_duration, turn_budget_ms, mcts_playout_policy, mcts_playout_depth, mcts_workers, 
+    mcts_max_nodes, mcts_selection, seed, record, mcts_stats,
+):
+    if mcts_stats and player_type != "mcts":
+        raise click.BadParameter("only the mcts player searches", param_hint="--mcts-stats")
+
     key_event_subject = Subject()
 
     if player_type == "interactive":
         player = InteractivePlayer(key_event_subject)
-    elif player_type == "simple":
-        player = SimplePlayer()
     else:
-        if mcts_playout_policy == "random":
-            select_move = select_move_random
-        else:
-            select_move = select_move_smart
-        player = MctsPlayer(
-            select_move=select_move, 
-            get_utility=get_complex_utility,
-            max_playout_depth=mcts_playout_depth,
+        player = create_computer_player(
+            player_type, 
+            mcts_playout_policy=mcts_playout_policy,
+            mcts_playout_depth=mcts_playout_depth,
+            mcts_workers=mcts_workers,
+            mcts_max_nodes=mcts_max_nodes,
+            mcts_selection=mcts_selection,
         )
+        if mcts_stats:
+            player.collect_search_stats = True
+
+    # The game thread may still be recording when the display is closed, so the file is 
+    # left to be closed as the process exits; every turn is flushed as it is recorded.
+    recorder = GameRecorder(open(record, "wb")) if record else None
+
+    conductor = GameConductor(
+        player, 
+        turn_budget_ms / 1000 if turn_budget_ms is not None else max_turn_duration, 
+        rx_background_scheduler,
+        seed=seed,
+        recorder=recorder,
+    )
+
+    if mcts_stats:
+        stats_file = open(mcts_stats, "w")
+
+        def write_stats(game_state, move, is_move_final):
+            # final moves are emitted on the game thread once the turn's search is over
+            if is_move_final:
+                stats_file.write(json.dumps(dict(turn=game_state.score, **player.last_search_stats)) + "\n")
+                stats_file.flush()
+
+        conductor.move_subject.subscribe(lambda v: write_stats(*v) if v is not None else None)
 
     with pygame_session():
-        GameDisplay(
-            GameConductor(player, max_turn_duration, rx_background_scheduler),
-            key_event_subject=key_event_subject,
-        ).run_game()
+        GameDisplay(conductor, key_event_subject=key_event_subject).run_game()
 
 
 if __name__ == "__main__":
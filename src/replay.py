@@ -0,0 +1,47 @@
+import click
+
+from tetris.model.gameplay.recording import read_recording, replay_recording
+from tetris.model.gameplay.selfplay import get_latency_percentiles
+
+
+@click.command()
+@click.argument("paths", nargs=-1, required=True)
+@click.option("--slowest", default=5, help="Number of turns with the longest think times to list.")
+def replay(paths, slowest):
+    """Replay game recordings without a display, checking that they produce the boards
+    that were recorded."""
+    mismatch_count = 0
+
+    for path in paths:
+        with open(path, "rb") as f:
+            recording = read_recording(f)
+        result = replay_recording(recording)
+        think_times = [t.think_time_sec for t in recording.turns]
+
+        click.echo(f"{path}: {len(recording.turns)} turns, seed {recording.seed}")
+        if result.mismatched_turn is None:
+            click.echo(
+                f"  verified{', game over' if result.is_game_over else ''} "
+                f"in {result.replay_time_sec * 1000:.1f} ms "
+                f"({result.turn_count / result.replay_time_sec if result.replay_time_sec else 0:.0f} turns/s)"
+            )
+        else:
+            mismatch_count += 1
+            click.echo(f"  MISMATCH at turn {result.mismatched_turn}: {recording.turns[result.mismatched_turn].move}")
+
+        percentiles = get_latency_percentiles(think_times)
+        click.echo("  think time ms: " + ", ".join(
+            f"{name} {value:.1f}" if value is not None else f"{name} -" for name, value in percentiles.items()
+        ))
+        for i, turn in sorted(enumerate(recording.turns), key=lambda e: e[1].think_time_sec, reverse=True)[:slowest]:
+            click.echo(
+                f"  turn {i}: {turn.think_time_sec * 1000:.1f} ms, "
+                f"{turn.iteration_count if turn.iteration_count is not None else '-'} iterations, {turn.move}"
+            )
+
+    if mismatch_count:
+        raise click.exceptions.Exit(1)
+
+
+if __name__ == "__main__":
+    replay()
@@ -0,0 +1,55 @@
+import json
+import sys
+import time
+
+import click
+
+from tetris.model.gameplay.selfplay import COMPUTER_PLAYER_TYPES, MCTS_SELECTIONS, get_selfplay_summary, play_games
+
+
+@click.command()
+@click.option("--game-count", default=10, help="Number of games to play.")
+@click.option("--workers", default=1, help="Number of processes playing games in parallel.")
+@click.option("--player-type", type=click.Choice(COMPUTER_PLAYER_TYPES), default="simple", help="The type of player to use.")
+@click.option("--max-turn-duration", default=1.0, help="Maximum duration of each turn in seconds.")
+@click.option("--max-turns", default=None, type=int, help="Stop games after this many turns; they are marked as truncated.")
+@click.option("--mcts-playout-policy", type=click.Choice(["random", "smart"]), default="smart", help="The manner of selecting moves during MCTS playout.")
+@click.option("--mcts-playout-depth", default=10, help="Max playout depth.")
+@click.option("--mcts-workers", default=1, help="Number of processes searching each turn of each game in parallel.")
+@click.option("--mcts-max-nodes", default=None, type=int, help="Most nodes kept in each search tree; the least played subtrees are pruned past it.")
+@click.option("--mcts-selection", type=click.Choice(MCTS_SELECTIONS), default="uct", help="UCT, or PUCT with priors from the utilities of the boards after each move and progressive widening.")
+@click.option("--seed", default=0, help="Seed of the first game; each following game adds one.")
+@click.option("--output", default="-", help="Output file for one JSON record per game, written as games finish.")
+def selfplay(
+    game_count, workers, player_type, max_turn_duration, max_turns, 
+    mcts_playout_policy, mcts_playout_depth, mcts_workers, mcts_max_nodes, mcts_selection, seed, output,
+):
+    player_kwargs = dict(player_type=player_type)
+    if player_type == "mcts":
+        player_kwargs.update(
+            mcts_playout_policy=mcts_playout_policy,
+            mcts_playout_depth=mcts_playout_depth,
+            mcts_workers=mcts_workers,
+            mcts_max_nodes=mcts_max_nodes,
+            mcts_selection=mcts_selection,
+        )
+
+    records = []
+    turn_latencies = []
+    start = time.perf_counter()
+    with click.open_file(output, "w") as f:
+        for record, game_turn_latencies in play_games(
+            game_count, player_kwargs, max_turn_duration, max_turns, workers, seed,
+        ):
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            records.append(record)
+            turn_latencies.extend(game_turn_latencies)
+
+    summary = get_selfplay_summary(records, turn_latencies, time.perf_counter() - start)
+    # keep the records alone on stdout when they are written there
+    click.echo(json.dumps(summary, indent=2), file=sys.stderr if output == "-" else sys.stdout)
+
+
+if __name__ == "__main__":
+    selfplay()
@@ -0,0 +1,193 @@
+import platform
+import random
+import time
+from collections import namedtuple
+from dataclasses import dataclass, replace
+
+from common.model.task import Task
+from tetris.model.board import create_initial_board_state, clear_full_rows, get_lowest_row
+from tetris.model.hyperparameters import get_game_score
+from tetris.model.mcts import TetrisTaskTree
+from tetris.model.strategy import get_complex_utility, get_complex_utility_batch, select_move_smart
+from tetris.model.task import TetrisTaskState
+from tetris.model.gameplay.common.game_state import GameState
+
+BENCHMARK_SEED = 0
+# the number of positions the per-position benchmarks run on
+POSITION_COUNT = 40
+# Each benchmark is repeated and its fastest repeat is kept, since slower repeats
+# mostly measure interference from the rest of the machine.
+REPEAT_COUNT = 5
+# a benchmark is only reported as a regression if it is slower than its baseline by
+# more than this fraction, so noise doesn't get flagged
+REGRESSION_THRESHOLD = 0.1
+MCTS_ITERATION_COUNT = 200
+MCTS_PLAYOUT_DEPTHS = (0, 3, 10)
+SIMULATE_PLAYOUT_DEPTH = 10
+GAME_COUNT = 3
+
+# create_run does the (untimed) setup of one repeat and produces the function to time
+# and the number of operations it performs
+Benchmark = namedtuple("Benchmark", "name create_run")
+BenchmarkComparison = namedtuple("BenchmarkComparison", "name baseline_sec_per_op sec_per_op ratio is_regression")
+
+
+@dataclass
+class IterationCountTask(Task):
+    """A task that lasts for a fixed number of checks of the time remaining."""
+    iteration_count: int
+
+    @property
+    def time_remaining(self):
+        self.iteration_count -= 1
+        return self.iteration_count >= 0
+
+
+def get_benchmark_positions(position_count=POSITION_COUNT, seed=BENCHMARK_SEED):
+    """Produce reproducible game states from the middle of games played by select_move_smart.
+
+    Positions are spread over whole games, so both low and high stacks are covered."""
+    random.seed(seed)
+    positions = []
+    while len(positions) < position_count:
+        state = TetrisTaskState(GameState(create_initial_board_state(), 0))
+        while state.possible_actions and len(positions) < position_count:
+            state = state.perform_action(select_move_smart(state, state.possible_actions))
+            if random.random() < 0.2:
+                positions.append(state)
+    return positions
+
+
+def _create_run_possible_moves(positions):
+    # fresh copies, since possible moves are cached on each state
+    board_states = [replace(p.state.board_state) for p in positions]
+    return lambda: [bs.possible_moves for bs in board_states], len(board_states)
+
+
+def _create_run_play_move(positions):
+    random.seed(BENCHMARK_SEED)
+    moves = [(p.state.board_state, m) for p in positions for m in p.possible_actions]
+    return lambda: [bs.play_move(m) for bs, m in moves], len(moves)
+
+
+def _create_run_clear_full_rows(positions):
+    # boards straight after a piece lands, before any full rows are cleared
+    boards = []
+    for p in positions:
+        board = p.state.board
+        for m in p.possible_actions:
+            piece = p.state.get_piece_for_move(m)
+            boards.append(board.place_piece(piece, get_lowest_row(board, piece, m.col), m.col))
+    return lambda: [clear_full_rows(b) for b in boards], len(boards)
+
+
+def _create_run_get_complex_utility(positions):
+    return lambda: [get_complex_utility(p) for p in positions], len(positions)
+
+
+def _create_run_select_move_smart(positions):
+    random.seed(BENCHMARK_SEED)
+    return lambda: [select_move_smart(p, p.possible_actions) for p in positions], len(positions)
+
+
+def _create_run_simulate(positions):
+    random.seed(BENCHMARK_SEED)
+    tree = TetrisTaskTree(positions[0], select_move=select_move_smart)
+    return (
+        lambda: [tree.simulate(p, max_playout_depth=SIMULATE_PLAYOUT_DEPTH) for p in positions],
+        len(positions),
+    )
+
+
+def _create_create_run_mcts(max_playout_depth):
+    def create_run(positions):
+        random.seed(BENCHMARK_SEED)
+        tree = TetrisTaskTree(positions[len(positions) // 2], select_move=select_move_smart)
+
+        def run():
+            for _ in tree.mcts(IterationCountTask(MCTS_ITERATION_COUNT), max_playout_depth=max_playout_depth):
+                pass
+
+        return run, MCTS_ITERATION_COUNT
+
+    return create_run
+
+
+def _create_run_game(positions):
+    random.seed(BENCHMARK_SEED)
+    return lambda: [get_game_score(get_complex_utility_batch) for _ in range(GAME_COUNT)], GAME_COUNT
+
+
+BENCHMARKS = (
+    Benchmark("possible_moves", _create_run_possible_moves),
+    Benchmark("play_move", _create_run_play_move),
+    Benchmark("clear_full_rows", _create_run_clear_full_rows),
+    Benchmark("get_complex_utility", _create_run_get_complex_utility),
+    Benchmark("select_move_smart", _create_run_select_move_smart),
+    Benchmark("simulate", _create_run_simulate),
+    *(
+        Benchmark(f"mcts_iteration_depth_{depth}", _create_create_run_mcts(depth))
+        for depth in MCTS_PLAYOUT_DEPTHS
+    ),
+    Benchmark("game", _create_run_game),
+)
+
+
+def run_benchmark(benchmark, positions, repeat_count=REPEAT_COUNT):
+    """Produce the time per operation of the fastest repeat of a benchmark in seconds."""
+    best_sec_per_op = None
+    for _ in range(repeat_count):
+        run, op_count = benchmark.create_run(positions)
+        start = time.perf_counter()
+        run()
+        sec_per_op = (time.perf_counter() - start) / op_count
+        if best_sec_per_op is None or sec_per_op < best_sec_per_op:
+            best_sec_per_op = sec_per_op
+    return best_sec_per_op
+
+
+def run_benchmarks(names=None, repeat_count=REPEAT_COUNT, benchmarks=BENCHMARKS):
+    """Run the benchmarks with the given names, or all of them, producing a JSON-ready
+    dict of results."""
+    positions = get_benchmark_positions()
+    return dict(
+        python=platform.python_version(),
+        machine=platform.machine(),
+        created=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        sec_per_op={
+            b.name: run_benchmark(b, positions, repeat_count)
+            for b in benchmarks
+            if names is None or b.name in names
+        },
+    )
+
+
+def compare_benchmark_results(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Compare results against a baseline, producing a BenchmarkComparison for each
+    benchmark in both."""
+    return [
+        BenchmarkComparison(
+            name,
+            baseline["sec_per_op"][name],
+            sec_per_op,
+            sec_per_op / baseline["sec_per_op"][name],
+            sec_per_op > baseline["sec_per_op"][name] * (1 + threshold),
+        )
+        for name, sec_per_op in results["sec_per_op"].items()
+        if name in baseline["sec_per_op"]
+    ]
+
+
+def get_benchmark_report(results, comparisons=None):
+    """Produce a table of results, compared against a baseline if comparisons are given."""
+    comparison_by_name = {c.name: c for c in comparisons or ()}
+    lines = [f"{'benchmark':<28}{'µs/op':>12}{'ops/s':>12}{'baseline µs/op':>16}{'ratio':>8}"]
+    for name, sec_per_op in results["sec_per_op"].items():
+        line = f"{name:<28}{sec_per_op * 1e6:>12.1f}{1 / sec_per_op:>12.1f}"
+        comparison = comparison_by_name.get(name)
+        if comparison:
+            line += f"{comparison.baseline_sec_per_op * 1e6:>16.1f}{comparison.ratio:>8.2f}"
+            if comparison.is_regression:
+                line += "  REGRESSION"
+        lines.append(line)
+    return "\n".join(lines)
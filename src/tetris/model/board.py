@@ -1,13 +1,12 @@
 from enum import Enum, unique, auto
-from dataclasses import dataclass, field
-from random import randrange
-from functools import cached_property
+from dataclasses import dataclass, replace
+import random
+from functools import cached_property, lru_cache
 from collections import namedtuple
+from typing import Optional
 
 import numpy as np
 
-import common.util.np as np_util
-
 
 class Block:
     __slots__ = []
@@ -97,7 +96,91 @@ def get_block_placements_for_grid(grid):
 
 
 def get_block_grid_str(grid):
-    return str(np.vectorize(lambda v: "X" if is_block(v) else " ")(grid))
+    return str(np.vectorize(lambda v: "X" if v else " ")(grid))
+
+
+def get_row_masks_for_grid(grid):
+    """Produce one bitmask per grid row, with bit ``c`` set if column ``c`` holds a block."""
+    return tuple(
+        sum(1 << col for col, val in enumerate(row) if is_block(val))
+        for row in grid
+    )
+
+
+# the number of bits of a board row's cell codes each column takes up
+CELL_CODE_BIT_COUNT = 3
+CELL_CODE_MASK = (1 << CELL_CODE_BIT_COUNT) - 1
+
+
+def get_cell_code(piece_type):
+    """Produce the code of the cells a piece type fills; 0 is the code of an empty cell."""
+    return piece_type.value
+
+
+def get_row_cell_codes_for_mask(mask, code):
+    """Produce the cell codes of a row with the given code in every column of a bitmask."""
+    codes = 0
+    col = 0
+    while mask >> col:
+        if mask >> col & 1:
+            codes |= code << col * CELL_CODE_BIT_COUNT
+        col += 1
+    return codes
+
+
+PieceShape = namedtuple(
+    "PieceShape", 
+    "grid block_placements block_row_sum row_count col_count top_profile bottom_profile row_masks row_cell_codes",
+)
+
+
+def create_piece_shape(piece_type, orientation):
+    grid = np.rot90(get_grid_for_piece_type(piece_type), k=orientation.value)
+    grid.flags.writeable = False
+    block_placements = tuple(get_block_placements_for_grid(grid))
+    row_count, col_count = grid.shape
+    row_masks = get_row_masks_for_grid(grid)
+    return PieceShape(
+        grid=grid,
+        block_placements=block_placements,
+        block_row_sum=sum(p.row for p in block_placements),
+        row_count=row_count,
+        col_count=col_count,
+        # the highest and lowest rows holding a block in each column
+        top_profile=tuple(
+            min(p.row for p in block_placements if p.col == col) for col in range(col_count)
+        ),
+        bottom_profile=tuple(
+            max(p.row for p in block_placements if p.col == col) for col in range(col_count)
+        ),
+        row_masks=row_masks,
+        row_cell_codes=tuple(
+            get_row_cell_codes_for_mask(mask, get_cell_code(piece_type)) for mask in row_masks
+        ),
+    )
+
+
+# every piece type and orientation is only laid out once
+PIECE_SHAPES = {
+    (piece_type, orientation): create_piece_shape(piece_type, orientation)
+    for piece_type in PieceType
+    for orientation in PieceOrientation
+}
+
+
+def get_canonical_orientation(piece_type, orientation):
+    """Produce the first orientation (in definition order) that gives the piece the same shape."""
+    row_masks = PIECE_SHAPES[piece_type, orientation].row_masks
+    return next(o for o in PieceOrientation if PIECE_SHAPES[piece_type, o].row_masks == row_masks)
+
+
+# orientations that are rotations of the same shape would produce duplicate moves
+DISTINCT_ORIENTATIONS_BY_PIECE_TYPE = {
+    piece_type: tuple(
+        o for o in PieceOrientation if get_canonical_orientation(piece_type, o) == o
+    )
+    for piece_type in PieceType
+}
 
 
 @dataclass(frozen=True)
@@ -105,49 +188,110 @@ class Piece:
     piece_type: PieceType
     orientation: PieceOrientation
 
+    @cached_property
+    def shape(self):
+        return PIECE_SHAPES[self.piece_type, self.orientation]
+
     @cached_property
     def grid(self):
-        return np.rot90(get_grid_for_piece_type(self.piece_type), k=self.orientation.value)
+        return self.shape.grid
 
     @cached_property
     def row_count(self):
-        return self.grid.shape[0]
+        return self.shape.row_count
 
     @cached_property
     def col_count(self):
-        return self.grid.shape[1]
+        return self.shape.col_count
 
     @cached_property
     def block_placements(self):
-        return get_block_placements_for_grid(self.grid)
+        return self.shape.block_placements
+
+    @cached_property
+    def block_row_sum(self):
+        return self.shape.block_row_sum
+
+    @cached_property
+    def top_profile(self):
+        return self.shape.top_profile
+
+    @cached_property
+    def bottom_profile(self):
+        return self.shape.bottom_profile
+
+    @cached_property
+    def row_masks(self):
+        return self.shape.row_masks
+
+    @cached_property
+    def row_cell_codes(self):
+        return self.shape.row_cell_codes
 
     def __str__(self):
         return get_block_grid_str(self.grid)
 
     def rotated_90_ccw(self, rotation_count=1):
-        return Piece(
+        return get_piece(
             self.piece_type,
             self.orientation.rotated_90_ccw(rotation_count=rotation_count),
         )
 
 
+PIECES = {key: Piece(*key) for key in PIECE_SHAPES}
+
+
+def get_piece(piece_type, orientation):
+    return PIECES[piece_type, orientation]
+
+
+def get_grids_for_rows(rows, col_count):
+    """Produce boolean occupancy grids from row bitmasks.
+
+    The rows may be stacked, e.g. as an array of shape (board count, row count)."""
+    return (np.asarray(rows, dtype=np.int64)[..., np.newaxis] >> np.arange(col_count) & 1).astype(bool)
+
+
 # NOTE: To see the absolute worst bug in the world, remove "eq=False" and use
 # the functools.cache annotation on any method
 @dataclass(frozen=True, eq=False)
 class Board:
-    grid: np.array
+    """A bitboard: one integer per row, with bit ``c`` set if column ``c`` holds a block.
+
+    Which piece type each block came from is only needed to draw the board, so it is 
+    tracked only when ``cell_codes`` is given: one integer per row, with the code of 
+    the piece type in column ``c`` (see get_cell_code) in bits 
+    ``c * CELL_CODE_BIT_COUNT`` and up."""
+    rows: tuple
+    col_count: int
+    cell_codes: Optional[tuple] = None
 
     @cached_property
     def row_count(self):
-        return self.grid.shape[0]
+        return len(self.rows)
 
     @cached_property
-    def col_count(self):
-        return self.grid.shape[1]
+    def full_row_mask(self):
+        return (1 << self.col_count) - 1
+
+    @cached_property
+    def grid(self):
+        """Produce the board occupancy as a boolean array."""
+        return get_grids_for_rows(self.rows, self.col_count)
 
     @cached_property
     def block_placements(self):
-        return get_block_placements_for_grid(self.grid)
+        # untracked boards have no piece types; the placement only marks the coordinate
+        return [
+            GridPlacement(row, col, self.get_cell_piece_type(row, col))
+            for row, mask in enumerate(self.rows)
+            for col in range(self.col_count)
+            if mask >> col & 1
+        ]
+
+    @property
+    def is_tracking_cell_codes(self):
+        return self.cell_codes is not None
 
     def __str__(self):
         return get_block_grid_str(self.grid)
@@ -156,36 +300,61 @@ class Board:
         """Determine whether a block can be placed at a given coordinate.
 
         If the coordinate is off the board, a block cannot be placed."""
-        val = np_util.arr_get_safe(self.grid, (row, col))
-        return not (is_block(val) or val is None)
+        return (
+            0 <= row < self.row_count
+            and 0 <= col < self.col_count
+            and not self.rows[row] >> col & 1
+        )
 
     def is_row_full(self, row):
-        return not any(self.is_coord_empty(row, col) for col in range(self.col_count))
+        return self.rows[row] == self.full_row_mask
+
+    def get_cell_piece_type(self, row, col):
+        """Produce the type of the piece a block came from, or None for empty cells and 
+        untracked boards."""
+        if not self.is_tracking_cell_codes:
+            return None
+        code = self.cell_codes[row] >> col * CELL_CODE_BIT_COUNT & CELL_CODE_MASK
+        return PieceType(code) if code else None
+
+    def without_cell_codes(self):
+        """Produce a board with the same occupancy that does not track cell codes."""
+        return Board(self.rows, self.col_count) if self.is_tracking_cell_codes else self
+
+    def place_piece(self, piece, row, col):
+        """Produce a new board with a piece placed with its top left corner at a coordinate."""
+        new_rows = list(self.rows)
+        for i, mask in enumerate(piece.row_masks):
+            new_rows[row + i] |= mask << col
+
+        new_cell_codes = None
+        if self.is_tracking_cell_codes:
+            new_cell_codes = list(self.cell_codes)
+            for i, codes in enumerate(piece.row_cell_codes):
+                new_cell_codes[row + i] |= codes << col * CELL_CODE_BIT_COUNT
+            new_cell_codes = tuple(new_cell_codes)
+
+        return Board(tuple(new_rows), self.col_count, new_cell_codes)
 
-    def place(self, placements):
-        """Produce a new board similar to this one but with the specified coordinates filled."""
-        new_grid = np.copy(self.grid)
-
-        for placement in placements:
-            new_grid[placement.row, placement.col] = placement.val
+    def clear_rows(self, rows):
+        if not rows:
+            return self
 
-        return Board(new_grid)
+        new_rows = (0,) * len(rows) + tuple(
+            mask for row, mask in enumerate(self.rows) if row not in rows
+        )
 
-    def clear_rows(self, rows):
-        return Board(
-            np.vstack(
-                [
-                    *[[make_space() for _ in range(self.col_count)] for _ in range(len(rows))],
-                    *np.delete(self.grid, rows, axis=0),
-                ]
+        new_cell_codes = None
+        if self.is_tracking_cell_codes:
+            new_cell_codes = (0,) * len(rows) + tuple(
+                codes for row, codes in enumerate(self.cell_codes) if row not in rows
             )
-        )
 
+        return Board(new_rows, self.col_count, new_cell_codes)
 
-def create_initial_board():
-    grid = np.zeros((20, 10), dtype=np.object)
-    grid.flags.writeable = False
-    return Board(grid)
+
+def create_initial_board(row_count=20, col_count=10, track_cell_codes=False):
+    return Board((0,) * row_count, col_count, (0,) * row_count if track_cell_codes else None)
 
 
 Move = namedtuple("Move", "col orientation")
@@ -195,16 +364,108 @@ def can_place_at_coord(board, piece, row, col):
     """Determine whether a piece can be placed in the given column.
 
     Return False if the piece overlaps another piece or is out of bounds."""
-    for placement in piece.block_placements:
-        if not board.is_coord_empty(placement.row + row, placement.col + col):
+    # piece grids are tight around their blocks, so bounds checks only need the grid size
+    if row < 0 or col < 0 or row + piece.row_count > board.row_count or col + piece.col_count > board.col_count:
+        return False
+
+    rows = board.rows
+    for i, mask in enumerate(piece.row_masks):
+        if rows[row + i] & mask << col:
             return False
     return True
 
 
-def get_lowest_row(board, piece, col):
+def get_column_heights(board):
+    """Produce the height of the highest block in each column, or 0 for empty columns."""
+    heights = [0] * board.col_count
+    seen_mask = 0
+    for row, mask in enumerate(board.rows):
+        new_mask = mask & ~seen_mask
+        if new_mask:
+            seen_mask |= new_mask
+            for col in range(board.col_count):
+                if new_mask >> col & 1:
+                    heights[col] = board.row_count - row
+            if seen_mask == board.full_row_mask:
+                break
+    return tuple(heights)
+
+
+def get_column_height(board, col):
+    """Produce the height of the highest block in a column, or 0 for an empty column."""
+    for row, mask in enumerate(board.rows):
+        if mask >> col & 1:
+            return board.row_count - row
+    return 0
+
+
+def get_bit_count(mask):
+    return bin(mask).count("1")
+
+
+def get_block_count(board):
+    return sum(get_bit_count(mask) for mask in board.rows)
+
+
+def get_row_sum(board):
+    """Produce the sum of the row indices of all blocks."""
+    return sum(row * get_bit_count(mask) for row, mask in enumerate(board.rows))
+
+
+# fixed so that positions hash the same in every process
+ZOBRIST_SEED = 0x7e7415
+
+
+@lru_cache(maxsize=None)
+def get_zobrist_row_keys(row_count, col_count):
+    """Produce a random key for every possible mask of every row of a board size.
+
+    The key of an empty row is 0, so empty rows don't affect a hash."""
+    keys = np.random.default_rng(ZOBRIST_SEED).integers(
+        1, 2 ** 63, size=(row_count, 2 ** col_count), dtype=np.int64,
+    )
+    keys[:, 0] = 0
+    return tuple(tuple(row_keys) for row_keys in keys.tolist())
+
+
+ZOBRIST_PIECE_TYPE_KEYS = dict(
+    zip(
+        PieceType, 
+        np.random.default_rng(ZOBRIST_SEED + 1).integers(1, 2 ** 63, size=len(PieceType)).tolist(),
+    )
+)
+
+
+def get_rows_hash(rows, row_keys, start=0, stop=None):
+    """Produce the Zobrist hash of the masks of a range of rows."""
+    h = 0
+    for row in range(start, len(rows) if stop is None else stop):
+        h ^= row_keys[row][rows[row]]
+    return h
+
+
+def get_board_hash(board):
+    return get_rows_hash(board.rows, get_zobrist_row_keys(board.row_count, board.col_count))
+
+
+def get_lowest_row(board, piece, col, column_heights=None):
     """Determine the bottommost row in which a piece can be placed given a column.
 
-    Pieces are automatically placed as far down as possible. Determine the row here."""
+    Pieces are automatically placed as far down as possible. Determine the row here.
+
+    If the column heights of the board are given, the row is taken from the piece's 
+    bottom profile unless a column has blocks above the bottom of the piece."""
+    if column_heights is not None:
+        row = board.row_count
+        for c, bottom in enumerate(piece.bottom_profile):
+            # the first row below the piece that holds a block in this column
+            top = board.row_count - column_heights[col + c]
+            if top <= bottom:
+                break
+            row = min(row, top - bottom - 1)
+        else:
+            return row
+
     placement_row = 0
     for row in range(board.row_count):
         if not can_place_at_coord(board, piece, row, col):
@@ -214,63 +475,191 @@ def get_lowest_row(board, piece, col):
     return placement_row
 
 
-def clear_full_rows(board):
-    return board.clear_rows(tuple(row for row in range(board.row_count) if board.is_row_full(row)))
+def get_full_rows(board, rows=None):
+    """Produce the full rows of a board, only checking the given rows if specified."""
+    return tuple(
+        row 
+        for row in (range(board.row_count) if rows is None else rows) 
+        if board.is_row_full(row)
+    )
+
+
+def clear_full_rows(board, rows=None):
+    return board.clear_rows(get_full_rows(board, rows))
 
 
 @dataclass(frozen=True)
 class BoardState:
     board: Board
-    piece_type: PieceType
-    piece_cache: dict = field(default_factory=dict)
+    # None for afterstates, where the next piece is not known yet
+    piece_type: Optional[PieceType]
+    # the number of rows cleared by the move that produced this state
+    lines_cleared: int = 0
+    # running values describing the board, updated from the previous state's values 
+    # by each move; derived from the board if not given
+    column_heights: Optional[tuple] = None
+    block_count: Optional[int] = None
+    row_sum: Optional[int] = None
+    highest_row: Optional[int] = None
+    # the Zobrist hash of the board's blocks
+    board_hash: Optional[int] = None
+
+    def __post_init__(self):
+        if self.column_heights is None:
+            object.__setattr__(self, "column_heights", get_column_heights(self.board))
+        if self.block_count is None:
+            object.__setattr__(self, "block_count", get_block_count(self.board))
+        if self.row_sum is None:
+            object.__setattr__(self, "row_sum", get_row_sum(self.board))
+        if self.highest_row is None:
+            object.__setattr__(self, "highest_row", self.board.row_count - max(self.column_heights))
+        if self.board_hash is None:
+            object.__setattr__(self, "board_hash", get_board_hash(self.board))
+
+    @property
+    def zobrist_hash(self):
+        """Produce a hash of the blocks and the piece type, equal for states with the same
+        position (see has_same_position) except for the odd 64 bit collision."""
+        return self.board_hash ^ ZOBRIST_PIECE_TYPE_KEYS.get(self.piece_type, 0)
+
+    @property
+    def hole_count(self):
+        """Produce the number of empty spaces below the highest block of their column."""
+        return sum(self.column_heights) - self.block_count
 
     @cached_property
     def possible_moves(self):
-        """Produce a list of all possible moves for the current state."""
+        """Produce a list of all possible moves for the current state.
+
+        Orientations that give the piece the same shape only produce one move."""
+        board = self.board
         return [
             Move(col, orientation)
-            for orientation in PieceOrientation
-            for col in range(self.board.col_count)
-            if can_place_at_coord(self.board, Piece(self.piece_type, orientation), 0, col)
+            for orientation in DISTINCT_ORIENTATIONS_BY_PIECE_TYPE[self.piece_type]
+            for col in range(board.col_count)
+            if can_place_at_coord(board, get_piece(self.piece_type, orientation), 0, col)
         ]
 
-    # NOTE: I initially used functools.cache here, but if you use it on a method of a non-hashable 
-    # class, you end up with an absolutely terrible memory leak
     def get_piece_for_move(self, move):
-        # cache pieces so other components can use blocks by reference
-        # not a performance optimization
-        piece = self.piece_cache.get(move)
-
-        if piece is None:
-            piece = Piece(self.piece_type, move.orientation)
-            self.piece_cache[move] = piece
+        return get_piece(self.piece_type, move.orientation)
+
+    def get_landing_row(self, move):
+        """Determine the row the top of the current piece lands in for a move."""
+        return get_lowest_row(self.board, self.get_piece_for_move(move), move.col, self.column_heights)
+
+    def has_same_position(self, other):
+        """Determine whether another state has the same blocks and piece type."""
+        return self.piece_type == other.piece_type and self.board.rows == other.board.rows
+
+    def without_cell_codes(self):
+        """Produce a similar state whose board does not track cell codes."""
+        return replace(self, board=self.board.without_cell_codes())
+
+    def _drop_piece(self, piece, col):
+        """Place a piece as far down as it goes in a column, producing the new board, 
+        the row the piece landed in and the rows it filled."""
+        row = get_lowest_row(self.board, piece, col, self.column_heights)
+        board = self.board.place_piece(piece, row, col)
+        # only the rows the piece landed in can have been filled
+        return board, row, get_full_rows(board, range(row, row + piece.row_count))
+
+    def _place_piece(self, piece, col, next_piece_type=None):
+        """Produce the state after placing a piece in a column.
+
+        Without a next piece type, this is the afterstate of the move."""
+        board, row, full_rows = self._drop_piece(piece, col)
+        row_count = board.row_count
+        col_count = board.col_count
+        row_keys = get_zobrist_row_keys(row_count, col_count)
+        piece_rows = range(row, row + piece.row_count)
+        board_hash = (
+            self.board_hash
+            ^ get_rows_hash(self.board.rows, row_keys, piece_rows.start, piece_rows.stop)
+            ^ get_rows_hash(board.rows, row_keys, piece_rows.start, piece_rows.stop)
+        )
 
-        return piece
+        piece_block_count = len(piece.block_placements)
+        block_count = self.block_count + piece_block_count
+        row_sum = self.row_sum + row * piece_block_count + piece.block_row_sum
+        # the top row of a piece always holds a block
+        highest_row = min(self.highest_row, row)
+        column_heights = list(self.column_heights)
+        for c, top in enumerate(piece.top_profile):
+            column_heights[col + c] = max(column_heights[col + c], row_count - row - top)
+
+        if full_rows:
+            block_count -= col_count * len(full_rows)
+            row_sum -= col_count * sum(full_rows)
+            # blocks above cleared rows move down by the number of cleared rows below them
+            shift = 0
+            for r in range(full_rows[-1], highest_row - 1, -1):
+                if r in full_rows:
+                    shift += 1
+                else:
+                    row_sum += shift * get_bit_count(board.rows[r])
+
+            # every row down to the lowest cleared row may have changed
+            board_hash ^= get_rows_hash(board.rows, row_keys, highest_row, full_rows[-1] + 1)
+            board = board.clear_rows(full_rows)
+            board_hash ^= get_rows_hash(board.rows, row_keys, highest_row, full_rows[-1] + 1)
+            for c in range(col_count):
+                if row_count - column_heights[c] in full_rows:
+                    # the highest block of the column was cleared
+                    column_heights[c] = get_column_height(board, c)
+                else:
+                    column_heights[c] -= len(full_rows)
+            highest_row = row_count - max(column_heights)
+
+        return BoardState(
+            board,
+            next_piece_type,
+            lines_cleared=len(full_rows),
+            column_heights=tuple(column_heights),
+            block_count=block_count,
+            row_sum=row_sum,
+            highest_row=highest_row,
+            board_hash=board_hash,
+        )
 
     def _play_piece(self, piece, col):
-        return create_new_board_state(
-            clear_full_rows(
-                self.board.place(
-                    tuple(
-                        GridPlacement(
-                            p.row + get_lowest_row(self.board, piece, col),
-                            p.col + col,
-                            p.val,
-                        )
-                        for p in piece.block_placements
-                    )
-                )
-            )
-        )
+        return self._place_piece(piece, col, get_random_piece_type())
 
     def play_move(self, move):
         """Produce a new state with the current piece placed and a new random piece type."""
         return self._play_piece(self.get_piece_for_move(move), move.col)
 
+    def get_afterstate(self, move):
+        """Produce the state with the current piece placed, before the next piece type is drawn."""
+        return self._place_piece(self.get_piece_for_move(move), move.col)
+
+    def with_piece_type(self, piece_type):
+        return replace(self, piece_type=piece_type)
+
+    def get_afterstates(self, moves):
+        """Produce the board rows resulting from each move, with full rows cleared, 
+        and the number of rows each move cleared.
+
+        The rows are stacked into an array of shape (move count, row count), so all 
+        moves can be evaluated at once without creating a state for each."""
+        afterstate_rows = []
+        lines_cleared = []
+        for move in moves:
+            board, _, full_rows = self._drop_piece(self.get_piece_for_move(move), move.col)
+            afterstate_rows.append(board.clear_rows(full_rows).rows)
+            lines_cleared.append(len(full_rows))
+        return (
+            np.array(afterstate_rows, dtype=np.int64).reshape(len(moves), self.board.row_count),
+            np.array(lines_cleared),
+        )
+
+
+def get_random_piece_type(rng=random):
+    return PieceType(rng.randrange(len(PieceType)) + 1)
+
 
-def create_new_board_state(board):
-    return BoardState(board, PieceType(randrange(len(PieceType)) + 1))
+def create_new_board_state(board, rng=random):
+    return BoardState(board, get_random_piece_type(rng))
 
 
-def create_initial_board_state():
-    return create_new_board_state(create_initial_board())
+def create_initial_board_state(track_cell_codes=False, rng=random):
+    return create_new_board_state(create_initial_board(track_cell_codes=track_cell_codes), rng)
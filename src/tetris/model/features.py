@@ -0,0 +1,147 @@
+import numpy as np
+
+from tetris.model.board import get_bit_count
+
+# Every feature is a proportion where larger values indicate a healthier board.
+FEATURE_NAMES = (
+    "concealed_space",
+    "empty_row",
+    "row_sum",
+    "column_height",
+    "bumpiness",
+    "well",
+    "row_transition",
+    "column_transition",
+    "lines_cleared",
+)
+
+# the most rows a single piece can clear
+MAX_LINES_CLEARED = 4
+
+
+def get_column_heights(grids):
+    """Produce the height of the highest block in each column for a stack of board grids."""
+    return np.logical_or.accumulate(grids, axis=1).sum(axis=1)
+
+
+def get_concealed_space_counts(grids, column_heights):
+    """Produce the number of empty spaces below the highest block of their column."""
+    return column_heights.sum(axis=1) - grids.sum(axis=(1, 2))
+
+
+def get_row_sums(grids):
+    """Produce the sum of the row indices of all blocks."""
+    return grids.sum(axis=2) @ np.arange(grids.shape[1])
+
+
+def get_bumpiness(column_heights):
+    """Produce the sum of the height differences between neighboring columns."""
+    return np.abs(np.diff(column_heights, axis=1)).sum(axis=1)
+
+
+def get_well_depths(column_heights, row_count):
+    """Produce the summed depth of columns that are lower than both their neighbors.
+
+    The walls count as neighbors of full height."""
+    left_heights = np.full_like(column_heights, row_count)
+    left_heights[:, 1:] = column_heights[:, :-1]
+    right_heights = np.full_like(column_heights, row_count)
+    right_heights[:, :-1] = column_heights[:, 1:]
+    return np.maximum(np.minimum(left_heights, right_heights) - column_heights, 0).sum(axis=1)
+
+
+def get_row_transitions(grids):
+    """Produce the number of horizontal changes between blocks and spaces in occupied rows.
+
+    The walls count as blocks."""
+    walled_grids = np.pad(grids, ((0, 0), (0, 0), (1, 1)), constant_values=True)
+    transitions = (walled_grids[:, :, 1:] != walled_grids[:, :, :-1]).sum(axis=2)
+    return (transitions * grids.any(axis=2)).sum(axis=1)
+
+
+def get_column_transitions(grids):
+    """Produce the number of vertical changes between blocks and spaces.
+
+    The floor counts as blocks."""
+    floored_grids = np.pad(grids, ((0, 0), (0, 1), (0, 0)), constant_values=True)
+    return (floored_grids[:, 1:, :] != floored_grids[:, :-1, :]).sum(axis=(1, 2))
+
+
+def get_board_features_batch(grids, lines_cleared=None):
+    """Produce a matrix with one row of features (see FEATURE_NAMES) for each of a stack
+    of board grids of shape (board count, row count, col count).
+
+    :param lines_cleared: The number of rows cleared by the move producing each board."""
+    board_count, row_count, col_count = grids.shape
+    cell_count = row_count * col_count
+    if lines_cleared is None:
+        lines_cleared = np.zeros(board_count)
+
+    column_heights = get_column_heights(grids)
+
+    return np.column_stack(
+        [
+            1 - get_concealed_space_counts(grids, column_heights) / cell_count,
+            (row_count - column_heights.max(axis=1)) / row_count,
+            get_row_sums(grids) / (row_count * (row_count - 1) * col_count // 2),
+            1 - column_heights.sum(axis=1) / cell_count,
+            1 - get_bumpiness(column_heights) / (row_count * (col_count - 1)),
+            1 - get_well_depths(column_heights, row_count) / cell_count,
+            1 - get_row_transitions(grids) / (row_count * (col_count + 1)),
+            1 - get_column_transitions(grids) / cell_count,
+            np.asarray(lines_cleared) / MAX_LINES_CLEARED,
+        ]
+    )
+
+
+def get_board_features(grid, lines_cleared=0):
+    """Produce the features (see FEATURE_NAMES) of a single board grid."""
+    return get_board_features_batch(grid[np.newaxis], np.array([lines_cleared]))[0]
+
+
+def get_row_transition_count(mask, col_count):
+    walled_mask = 1 | mask << 1 | 1 << (col_count + 1)
+    return get_bit_count((walled_mask ^ walled_mask >> 1) & ((1 << (col_count + 1)) - 1))
+
+
+def get_board_state_features(board_state):
+    """Produce the features (see FEATURE_NAMES) of a board state from its running values.
+
+    Only the occupied rows are visited, so this is much cheaper than a pass over the grid."""
+    board = board_state.board
+    row_count = board.row_count
+    col_count = board.col_count
+    cell_count = row_count * col_count
+    rows = board.rows
+    column_heights = board_state.column_heights
+    highest_row = board_state.highest_row
+
+    walled_heights = (row_count, *column_heights, row_count)
+    well_depth = sum(
+        max(min(walled_heights[c], walled_heights[c + 2]) - column_heights[c], 0) 
+        for c in range(col_count)
+    )
+    bumpiness = sum(abs(a - b) for a, b in zip(column_heights, column_heights[1:]))
+    row_transition_count = sum(
+        get_row_transition_count(mask, col_count) for mask in rows[highest_row:] if mask
+    )
+    # the rows above the highest block are empty, so they add no transitions
+    first_row = max(highest_row, 1)
+    column_transition_count = sum(
+        get_bit_count(upper ^ lower) for upper, lower in zip(rows[first_row - 1:], rows[first_row:])
+    ) + get_bit_count(rows[-1] ^ board.full_row_mask)
+
+    return np.array(
+        [
+            1 - board_state.hole_count / cell_count,
+            highest_row / row_count,
+            board_state.row_sum / (row_count * (row_count - 1) * col_count // 2),
+            1 - sum(column_heights) / cell_count,
+            1 - bumpiness / (row_count * (col_count - 1)),
+            1 - well_depth / cell_count,
+            1 - row_transition_count / (row_count * (col_count + 1)),
+            1 - column_transition_count / cell_count,
+            board_state.lines_cleared / MAX_LINES_CLEARED,
+        ]
+    )
+
@@ -1,68 +1,122 @@
-from dataclasses import dataclass
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
 
-from rx.subject import Subject, ReplaySubject, BehaviorSubject
-from rx.disposable import CompositeDisposable
+import rx
+from rx.scheduler import TimeoutScheduler
+from rx.subject import BehaviorSubject
 from rx import operators as op
 
-from tetris.model.gameplay.common.timer import create_countdown_obs, create_timer
+from tetris.model.gameplay.common.player import SynchronousPlayer
+from tetris.model.gameplay.common.timer import DeadlineTimer
 from tetris.model.gameplay.common.game_state import GameState
 from tetris.model.board import create_initial_board_state
 
+# how often the time remaining in the turn is emitted, in seconds
+TURN_TIME_REMAINING_INTERVAL_SEC = 1
+
 
 @dataclass
 class GameConductor:
+    """Plays a game, one turn after another, with a player.
+
+    Players that can choose a move synchronously (see SynchronousPlayer) are called
+    directly; otherwise the player's last move by the end of the turn is played. Either
+    way, each move the player considers is emitted as a preview before the final one."""
     player: ""
     max_turn_duration: int
     scheduler: ""
-    board_state_init: "" = create_initial_board_state()
-    move_subject: "" = BehaviorSubject(None)
-    turn_time_remaining_subject: "" = BehaviorSubject(None)
+    # an empty board if not given, drawn after seeding
+    board_state_init: "" = None
+    move_subject: "" = field(default_factory=lambda: BehaviorSubject(None))
+    turn_time_remaining_subject: "" = field(default_factory=lambda: BehaviorSubject(None))
+    # the end of the current turn in the time.monotonic clock
+    turn_deadline: Optional[float] = None
+    # the seed of the random pieces, if they should be reproducible
+    seed: Optional[int] = None
+    # records the game if given (see GameRecorder)
+    recorder: "" = None
+
+    @property
+    def turn_time_remaining(self):
+        return math.ceil(max(self.turn_deadline - time.monotonic(), 0))
+
+    def _preview_move(self, game_state, move):
+        self.move_subject.on_next((game_state, move, False))
 
-    def _run_game(self, game_state):
+    def _get_move_from_obs(self, game_state, deadline):
         move = None
+        is_turn_over = threading.Event()
 
         def set_move(new_move):
             nonlocal move
 
             if new_move is not None and new_move != move:
                 move = new_move
-                self.move_subject.on_next((game_state, move, False))
+                self._preview_move(game_state, move)
 
-        def play_move():
-            nonlocal move
+        disposable = self.player.get_move_obs(game_state.without_cell_codes(), DeadlineTimer(deadline)).pipe(
+            op.subscribe_on(self.scheduler),
+        ).subscribe(
+            on_next=set_move,
+            on_completed=is_turn_over.set,
+        )
+        is_turn_over.wait(max(deadline - time.monotonic(), 0))
+        disposable.dispose()
+        return move
 
-            turn_disposable.dispose()
+    def _get_move(self, game_state, deadline):
+        # Only the display needs to know which piece each block came from, so players
+        # get boards without cell codes, while the moves emitted keep them.
+        if isinstance(self.player, SynchronousPlayer):
+            return self.player.choose_move(
+                game_state.without_cell_codes(), 
+                deadline, 
+                on_move=lambda move: self._preview_move(game_state, move),
+            )
+        else:
+            return self._get_move_from_obs(game_state, deadline)
 
-            if move:
-                self.move_subject.on_next((game_state, move, True))
-                new_game_state = game_state.play_move(move)
-                move = None
-                self._run_game(new_game_state)
-            else:
-                self.turn_time_remaining_subject.on_completed()
-                self.move_subject.on_completed()
+    def play_game(self):
+        """Play turns until the player has no move, producing the final game state."""
+        if self.seed is not None:
+            random.seed(self.seed)
+        game_state = GameState(self.board_state_init or create_initial_board_state(track_cell_codes=True), 0)
+        if self.recorder:
+            self.recorder.record_start(game_state, self.seed)
+        self.player.prepare()
+        self.turn_deadline = time.monotonic() + self.max_turn_duration
 
-        countdown_obs = create_countdown_obs(self.max_turn_duration, scheduler=self.scheduler).pipe(
-            op.observe_on(self.scheduler),
-            op.subscribe_on(self.scheduler),
-        )
+        # one timer for the whole game; a timer thread rather than the scheduler, so a 
+        # scheduler thread isn't kept busy waiting
+        turn_time_remaining_disposable = rx.interval(
+            TURN_TIME_REMAINING_INTERVAL_SEC, scheduler=TimeoutScheduler(),
+        ).subscribe(lambda _: self.turn_time_remaining_subject.on_next(self.turn_time_remaining))
 
-        timer = create_timer(countdown_obs, self.max_turn_duration)
-
-        turn_disposable = CompositeDisposable(
-            self.player.get_move_obs(game_state, timer).pipe(
-                op.observe_on(self.scheduler),
-                op.subscribe_on(self.scheduler),
-            ).subscribe(
-                on_next=set_move, 
-                on_completed=play_move,
-            ),
-            countdown_obs.subscribe(
-                on_next=self.turn_time_remaining_subject.on_next,
-                on_completed=play_move,
-            ),
-            timer.run(),
-        )
+        while True:
+            self.turn_deadline = time.monotonic() + self.max_turn_duration
+            self.turn_time_remaining_subject.on_next(self.max_turn_duration)
+
+            turn_start = time.perf_counter()
+            move = self._get_move(game_state, self.turn_deadline)
+            think_time = time.perf_counter() - turn_start
+            if move is None:
+                break
+
+            self.move_subject.on_next((game_state, move, True))
+            game_state = game_state.play_move(move)
+            if self.recorder:
+                self.recorder.record_turn(game_state, move, think_time, self.player.last_iteration_count)
+
+        turn_time_remaining_disposable.dispose()
+        self.turn_time_remaining_subject.on_completed()
+        self.move_subject.on_completed()
+        return game_state
 
     def run_game(self):
-        self._run_game(GameState(self.board_state_init, 0))
+        """Play the game in a background thread of its own, so it doesn't hold up one of 
+        the scheduler's threads for the whole game."""
+        threading.Thread(target=self.play_game, daemon=True).start()
@@ -21,8 +21,20 @@ class GameState:
     def possible_moves(self):
         return self.board_state.possible_moves
     
+    def without_cell_codes(self):
+        return GameState(self.board_state.without_cell_codes(), self.score)
+
     def get_piece_for_move(self, move):
         return self.board_state.get_piece_for_move(move)
 
+    def get_afterstates(self, moves):
+        return self.board_state.get_afterstates(moves)
+
     def play_move(self, move):
         return GameState(self.board_state.play_move(move), self.score + 1)
+
+    def get_afterstate(self, move):
+        return GameState(self.board_state.get_afterstate(move), self.score + 1)
+
+    def with_piece_type(self, piece_type):
+        return GameState(self.board_state.with_piece_type(piece_type), self.score)
@@ -4,4 +4,29 @@ from abc import ABC, abstractmethod
 class Player(ABC):
     @abstractmethod
     def get_move_obs(self, state, timer):
-        pass
\ No newline at end of file
+        pass
+
+    def prepare(self):
+        """Get ready to play before the first turn starts, so that setting up doesn't 
+        take from the turn's time."""
+        pass
+
+    @property
+    def last_iteration_count(self):
+        """The number of search iterations in the player's last or current turn; None 
+        for players that don't search."""
+        return None
+
+
+class SynchronousPlayer(Player):
+    """A player that doesn't wait for input, so it can choose a move synchronously and 
+    games can be played without Rx."""
+
+    @abstractmethod
+    def choose_move(self, state, deadline, on_move=None):
+        """Choose a move by a deadline in the time.monotonic clock, producing None if 
+        there is no move.
+
+        If given, on_move is called with each move the player settles on along the way,
+        so the move it is considering can be shown."""
+        pass
@@ -3,7 +3,7 @@ from dataclasses import dataclass
 import pygame
 from rx.subject import ReplaySubject
 
-from tetris.model.board import Move
+from tetris.model.board import Move, get_canonical_orientation
 from tetris.model.gameplay.common.player import Player
 from tetris.model.strategy import select_move_random
 
@@ -33,7 +33,11 @@ def _constrain_right(board_state, move):
 
 
 def _rotate(board_state, move):
-    rotated_move = Move(move.col, move.orientation.rotated_90_ccw())
+    # rotations that don't change the piece's shape are not separate moves
+    rotated_move = Move(
+        move.col, 
+        get_canonical_orientation(board_state.piece_type, move.orientation.rotated_90_ccw()),
+    )
     if rotated_move in board_state.possible_moves:
         return rotated_move
     else:
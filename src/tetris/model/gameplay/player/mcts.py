@@ -1,27 +1,148 @@
-from dataclasses import dataclass
-from typing import Callable, List, Optional
+import threading
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Callable, List, Optional
 
 import rx
 
-from tetris.model.mcts import TetrisTaskNode
+from common.model.mcts_stats import MctsSearchStats
+from common.model.parallel_mcts import MctsWorkerPool
+from common.model.task import DeadlineTask
+from common.model.transposition import TRANSPOSITION_TABLE_SIZE, TranspositionTable
+from tetris.model.mcts import TetrisTaskTree
 from tetris.model.strategy import select_move_random, get_complex_utility
-from tetris.model.task import TetrisMoveTask, TetrisTaskState
-from tetris.model.gameplay.common.player import Player
+from tetris.model.task import TetrisTaskState
+from tetris.model.gameplay.common.player import SynchronousPlayer
+
+
+def format_move(move):
+    return dict(col=move.col, orientation=move.orientation.name)
 
 
 @dataclass
-class MctsPlayer(Player):
-    """A Tetris player that uses the Monte Carlo Tree Search algorithm."""
+class MctsPlayer(SynchronousPlayer):
+    """A Tetris player that uses the Monte Carlo Tree Search algorithm.
+
+    The search tree is kept between turns; if the new state was reached from the last
+    turn's root, the search continues from that subtree. Positions reached by different
+    orders of moves share statistics through a transposition table, which is also kept
+    between turns."""
     select_move: Callable[[TetrisTaskState, List["Action"]], "Action"] = select_move_random
     get_utility: Callable[[TetrisTaskState], float] = get_complex_utility
     max_playout_depth: Optional[int] = None
+    # With more than one worker, each worker process searches the same state and their
+    # results are merged; otherwise the search runs on the calling thread.
+    worker_count: int = 1
+    # The least time between moves emitted during a search; a better move found sooner
+    # is emitted once it has passed. None to emit every better move.
+    min_move_interval_sec: Optional[float] = None
+    # the most positions in the transposition table; None to search without one
+    transposition_table_size: Optional[int] = TRANSPOSITION_TABLE_SIZE
+    # the most nodes each search tree keeps (see TaskTree.prune); None for no limit
+    max_node_count: Optional[int] = None
+    # whether to select moves by PUCT with priors from the utilities of their boards, 
+    # with progressive widening, rather than by UCT (see TaskTree.use_priors)
+    use_priors: bool = False
+    tree: Optional[TetrisTaskTree] = None
+    # the number of iterations of the last or current search on this thread
+    search_iteration_count: Optional[int] = None
+    # whether to record where each search's time goes (see last_search_stats)
+    collect_search_stats: bool = False
+    search_stats: Optional[MctsSearchStats] = None
+    # the previous turn's search may still be finishing an iteration in the tree
+    search_lock: Any = field(default_factory=threading.Lock)
 
-    def get_move_obs(self, game_state, timer):
-        return rx.from_iterable(
-            TetrisTaskNode(
-                TetrisTaskState(game_state), 
-                select_move=self.select_move,
-                get_utility=self.get_utility,
-            ).mcts(TetrisMoveTask(timer), max_playout_depth=self.max_playout_depth)
+    @cached_property
+    def worker_pool(self):
+        return MctsWorkerPool(self.worker_count)
+
+    @cached_property
+    def transposition_table(self):
+        if self.transposition_table_size:
+            return TranspositionTable(self.transposition_table_size)
+        else:
+            return None
+
+    def prepare(self):
+        if self.worker_count > 1:
+            self.worker_pool.start()
+
+    def _create_tree(self, task_state, transposition_table):
+        return TetrisTaskTree(
+            task_state, 
+            transposition_table=transposition_table,
+            max_node_count=self.max_node_count,
+            use_priors=self.use_priors,
+            select_move=self.select_move,
+            get_utility=self.get_utility,
+        )
+
+    @property
+    def last_iteration_count(self):
+        if self.worker_count > 1:
+            return self.worker_pool.iteration_count
+        return self.search_iteration_count
+
+    @property
+    def last_search_stats(self):
+        """Produce a JSON-ready record of the statistics of the last search (see 
+        MctsSearchStats) if collect_search_stats is set, with one record per worker if 
+        there is more than one."""
+        if not self.collect_search_stats:
+            return None
+        if self.worker_count > 1:
+            return dict(workers=[
+                s.to_record(format_move) for s in self.worker_pool.search_stats_by_conn.values()
+            ])
+        with self.search_lock:
+            return self.search_stats.to_record(format_move) if self.search_stats else None
+
+    def _search(self, task):
+        tree = self.tree
+        start_iteration_count = tree.iteration_count
+        self.search_iteration_count = 0
+        self.search_stats = MctsSearchStats() if self.collect_search_stats else None
+        moves = tree.mcts(
+            task, 
+            max_playout_depth=self.max_playout_depth, 
+            min_emission_interval_sec=self.min_move_interval_sec,
+            stats=self.search_stats,
         )
- 
\ No newline at end of file
+        while True:
+            with self.search_lock:
+                move = next(moves, None)
+                self.search_iteration_count = tree.iteration_count - start_iteration_count
+            if move is None:
+                return
+            yield move
+
+    def _get_moves(self, game_state, task):
+        """Produce an iterable of the best move so far, as the search goes on."""
+        task_state = TetrisTaskState(game_state)
+
+        if self.worker_count > 1:
+            # the workers keep their own trees and transposition tables
+            tree = self._create_tree(
+                task_state, 
+                TranspositionTable(self.transposition_table_size) if self.transposition_table_size else None,
+            )
+            return self.worker_pool.mcts(
+                tree, task, max_playout_depth=self.max_playout_depth, collect_stats=self.collect_search_stats,
+            )
+
+        with self.search_lock:
+            subtree = self.tree.get_subtree_for_state(task_state) if self.tree else None
+            self.tree = subtree or self._create_tree(task_state, self.transposition_table)
+
+        return self._search(task)
+
+    def get_move_obs(self, game_state, timer):
+        return rx.from_iterable(self._get_moves(game_state, DeadlineTask(timer.deadline)))
+
+    def choose_move(self, game_state, deadline, on_move=None):
+        move = None
+        # the search only yields a move when it changes (see min_move_interval_sec)
+        for move in self._get_moves(game_state, DeadlineTask(deadline)):
+            if on_move:
+                on_move(move)
+        return move
@@ -4,15 +4,21 @@ import rx
 
 from tetris.model.strategy import select_move_smart
 from tetris.model.task import TetrisTaskState
-from tetris.model.gameplay.common.player import Player
+from tetris.model.gameplay.common.player import SynchronousPlayer
 
 
 @dataclass
-class SimplePlayer(Player):
+class SimplePlayer(SynchronousPlayer):
     """A Tetris player that uses hardcoded logic."""
     select_move: "" = select_move_smart
 
-    def get_move_obs(self, game_state, timer):
+    def choose_move(self, game_state, deadline, on_move=None):
         task_state = TetrisTaskState(game_state)
         move = self.select_move(task_state, task_state.possible_actions)
+        if on_move and move is not None:
+            on_move(move)
+        return move
+
+    def get_move_obs(self, game_state, timer):
+        move = self.choose_move(game_state, None)
         return rx.just(move) if move is not None else rx.empty()
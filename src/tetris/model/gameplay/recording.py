@@ -0,0 +1,141 @@
+import struct
+import time
+from collections import namedtuple
+from dataclasses import dataclass
+from typing import Any
+
+from tetris.model.board import Board, BoardState, Move, PieceOrientation, PieceType
+from tetris.model.gameplay.common.game_state import GameState
+
+# A recording is a header, the masks of the rows of the initial board, then one record
+# per turn, all little-endian. A turn takes 14 bytes, so a game of 10000 turns takes
+# about 140 KB.
+RECORDING_MAGIC = b"TTRS"
+RECORDING_VERSION = 1
+# magic, version, row count, column count, whether the game was seeded, the seed (which 
+# may be negative) and the type of the first piece
+RECORDING_HEADER = struct.Struct("<4sBBB?qB")
+# the move and the type of the piece drawn after it (see pack_move), the think time in
+# microseconds, the number of search iterations and the low bits of the board's hash
+RECORDING_TURN = struct.Struct("<HIII")
+
+MOVE_COL_BIT_COUNT = 5
+MOVE_ORIENTATION_BIT_COUNT = 2
+MAX_UINT32 = 0xFFFFFFFF
+# iteration count of players that don't search
+UNKNOWN_ITERATION_COUNT = MAX_UINT32
+
+Recording = namedtuple("Recording", "seed initial_board_state turns")
+RecordedTurn = namedtuple("RecordedTurn", "move next_piece_type think_time_sec iteration_count board_hash")
+ReplayResult = namedtuple("ReplayResult", "turn_count is_game_over mismatched_turn game_state replay_time_sec")
+
+
+def pack_move(move, next_piece_type):
+    return (
+        move.col
+        | move.orientation.value << MOVE_COL_BIT_COUNT
+        | next_piece_type.value << MOVE_COL_BIT_COUNT + MOVE_ORIENTATION_BIT_COUNT
+    )
+
+
+def unpack_move(packed):
+    move = Move(
+        packed & (1 << MOVE_COL_BIT_COUNT) - 1,
+        PieceOrientation(packed >> MOVE_COL_BIT_COUNT & (1 << MOVE_ORIENTATION_BIT_COUNT) - 1),
+    )
+    return move, PieceType(packed >> MOVE_COL_BIT_COUNT + MOVE_ORIENTATION_BIT_COUNT)
+
+
+def get_recorded_board_hash(board_state):
+    return board_state.board_hash & MAX_UINT32
+
+
+@dataclass
+class GameRecorder:
+    """Writes a recording of a game to a binary file as the game is played.
+
+    Each turn is flushed as it is written, so a game cut short is still recorded up to
+    its last turn."""
+    file: Any
+
+    def record_start(self, game_state, seed=None):
+        board = game_state.board
+        self.file.write(RECORDING_HEADER.pack(
+            RECORDING_MAGIC,
+            RECORDING_VERSION,
+            board.row_count,
+            board.col_count,
+            seed is not None,
+            seed or 0,
+            game_state.piece_type.value,
+        ))
+        self.file.write(struct.pack(f"<{board.row_count}I", *board.rows))
+        self.file.flush()
+
+    def record_turn(self, new_game_state, move, think_time_sec, iteration_count=None):
+        """Record a move and the game state it produced."""
+        self.file.write(RECORDING_TURN.pack(
+            pack_move(move, new_game_state.piece_type),
+            min(round(think_time_sec * 1e6), MAX_UINT32),
+            UNKNOWN_ITERATION_COUNT if iteration_count is None else min(iteration_count, MAX_UINT32 - 1),
+            get_recorded_board_hash(new_game_state.board_state),
+        ))
+        self.file.flush()
+
+
+def read_recording(file):
+    """Read a recording written by GameRecorder, producing a Recording."""
+    magic, version, row_count, col_count, is_seeded, seed, piece_type = RECORDING_HEADER.unpack(
+        file.read(RECORDING_HEADER.size)
+    )
+    if magic != RECORDING_MAGIC:
+        raise ValueError("not a game recording")
+    if version != RECORDING_VERSION:
+        raise ValueError(f"unsupported game recording version {version}")
+
+    rows = struct.unpack(f"<{row_count}I", file.read(4 * row_count))
+    initial_board_state = BoardState(Board(rows, col_count), PieceType(piece_type))
+
+    data = file.read()
+    # a turn cut off while being written is left out
+    turn_data = memoryview(data)[:len(data) - len(data) % RECORDING_TURN.size]
+    turns = []
+    for packed_move, think_time_us, iteration_count, board_hash in RECORDING_TURN.iter_unpack(turn_data):
+        move, next_piece_type = unpack_move(packed_move)
+        turns.append(RecordedTurn(
+            move,
+            next_piece_type,
+            think_time_us / 1e6,
+            None if iteration_count == UNKNOWN_ITERATION_COUNT else iteration_count,
+            board_hash,
+        ))
+
+    return Recording(seed if is_seeded else None, initial_board_state, turns)
+
+
+def replay_recording(recording):
+    """Play the moves of a recording with its pieces, checking that every move is
+    possible and produces the board that was recorded.
+
+    Produce a ReplayResult with the index of the first turn that doesn't match, or None
+    if the whole game does."""
+    start = time.perf_counter()
+    game_state = GameState(recording.initial_board_state, 0)
+    mismatched_turn = None
+
+    for i, turn in enumerate(recording.turns):
+        if turn.move not in game_state.possible_moves:
+            mismatched_turn = i
+            break
+        game_state = game_state.get_afterstate(turn.move).with_piece_type(turn.next_piece_type)
+        if get_recorded_board_hash(game_state.board_state) != turn.board_hash:
+            mismatched_turn = i
+            break
+
+    return ReplayResult(
+        game_state.score,
+        mismatched_turn is None and not game_state.possible_moves,
+        mismatched_turn,
+        game_state,
+        time.perf_counter() - start,
+    )
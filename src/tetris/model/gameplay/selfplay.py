@@ -0,0 +1,131 @@
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from common.util.np import get_mean_and_standard_error
+from tetris.model.board import create_initial_board_state
+from tetris.model.strategy import select_move_random, select_move_smart, get_complex_utility
+from tetris.model.gameplay.common.game_state import GameState
+from tetris.model.gameplay.player.simple import SimplePlayer
+from tetris.model.gameplay.player.mcts import MctsPlayer
+
+COMPUTER_PLAYER_TYPES = ("simple", "random", "mcts")
+MCTS_SELECTIONS = ("uct", "puct")
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+def create_computer_player(
+    player_type,
+    mcts_playout_policy="smart",
+    mcts_playout_depth=10,
+    mcts_workers=1,
+    mcts_max_nodes=None,
+    mcts_selection="uct",
+):
+    """Create a player that needs no input (see COMPUTER_PLAYER_TYPES)."""
+    if player_type == "simple":
+        return SimplePlayer()
+    elif player_type == "random":
+        return SimplePlayer(select_move=select_move_random)
+    elif player_type == "mcts":
+        return MctsPlayer(
+            select_move=select_move_random if mcts_playout_policy == "random" else select_move_smart,
+            get_utility=get_complex_utility,
+            max_playout_depth=mcts_playout_depth,
+            worker_count=mcts_workers,
+            max_node_count=mcts_max_nodes,
+            use_priors=mcts_selection == "puct",
+        )
+    else:
+        raise ValueError(f"unknown player type {player_type}")
+
+
+def get_latency_percentiles(latencies_sec):
+    """Produce the given percentiles of turn latencies in milliseconds by name."""
+    if not latencies_sec:
+        return {f"p{p}": None for p in LATENCY_PERCENTILES}
+    values = np.percentile(np.array(latencies_sec) * 1000, LATENCY_PERCENTILES)
+    return {f"p{p}": float(v) for p, v in zip(LATENCY_PERCENTILES, values)}
+
+
+def play_game(player, max_turn_duration, max_turn_count=None):
+    """Play a game without a display, giving a SynchronousPlayer up to max_turn_duration 
+    seconds per turn to choose its move.
+
+    Produce a record of the game with the turn latencies in seconds."""
+    game_state = GameState(create_initial_board_state(), 0)
+    lines_cleared = 0
+    turn_latencies = []
+    player.prepare()
+    start = time.perf_counter()
+
+    while max_turn_count is None or game_state.score < max_turn_count:
+        turn_start = time.perf_counter()
+        move = player.choose_move(game_state, time.monotonic() + max_turn_duration)
+        turn_latencies.append(time.perf_counter() - turn_start)
+
+        if move is None:
+            break
+        game_state = game_state.play_move(move)
+        lines_cleared += game_state.board_state.lines_cleared
+
+    wall_time = time.perf_counter() - start
+    return dict(
+        pieces_placed=game_state.score,
+        lines_cleared=lines_cleared,
+        is_truncated=bool(game_state.possible_moves),
+        wall_time_sec=wall_time,
+        moves_per_sec=game_state.score / wall_time if wall_time else None,
+        turn_latencies_sec=turn_latencies,
+    )
+
+
+def _play_seeded_game(game_index, seed, player_kwargs, max_turn_duration, max_turn_count):
+    random.seed(seed)
+    player = create_computer_player(**player_kwargs)
+    record = play_game(player, max_turn_duration, max_turn_count)
+    turn_latencies = record.pop("turn_latencies_sec")
+    if isinstance(player, MctsPlayer) and player.worker_count > 1:
+        player.worker_pool.close()
+    return dict(
+        game=game_index,
+        seed=seed,
+        **player_kwargs,
+        **record,
+        turn_latency_ms=get_latency_percentiles(turn_latencies),
+    ), turn_latencies
+
+
+def play_games(game_count, player_kwargs, max_turn_duration, max_turn_count=None, worker_count=1, seed=0):
+    """Play games in worker processes, yielding the record of each game (see play_game)
+    and its turn latencies in seconds as it finishes.
+
+    Game i is seeded with seed + i, so a run can be reproduced game by game."""
+    with ProcessPoolExecutor(worker_count) as executor:
+        futures = [
+            executor.submit(_play_seeded_game, i, seed + i, player_kwargs, max_turn_duration, max_turn_count)
+            for i in range(game_count)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def get_selfplay_summary(records, turn_latencies, wall_time_sec):
+    """Summarize the records of the games of a run and all of their turn latencies."""
+    pieces_placed = [r["pieces_placed"] for r in records]
+    pieces_placed_mean, pieces_placed_standard_error = get_mean_and_standard_error(pieces_placed)
+    return dict(
+        game_count=len(records),
+        truncated_game_count=sum(r["is_truncated"] for r in records),
+        pieces_placed_mean=pieces_placed_mean,
+        pieces_placed_standard_error=pieces_placed_standard_error,
+        pieces_placed_min=min(pieces_placed),
+        pieces_placed_max=max(pieces_placed),
+        lines_cleared_mean=float(np.mean([r["lines_cleared"] for r in records])),
+        wall_time_sec=wall_time_sec,
+        # across all processes, so this measures the capacity of the machine
+        moves_per_sec=sum(pieces_placed) / wall_time_sec,
+        turn_latency_ms=get_latency_percentiles(turn_latencies),
+    )
@@ -1,37 +1,129 @@
 import functools
+import math
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
-from sklearn.model_selection import RandomizedSearchCV
+from scipy.stats import randint, uniform
+from sklearn.model_selection import ParameterSampler, RandomizedSearchCV
 from sklearn.base import BaseEstimator, RegressorMixin
 
-from common.model.task import create_select_action_by_utility
-from tetris.model.board import create_initial_board_state
-from tetris.model.strategy import get_complex_utility
+from common.util.np import get_mean_and_standard_error
+from tetris.model.board import create_initial_board_state, get_random_piece_type
+from tetris.model.features import FEATURE_NAMES, get_board_state_features
+from tetris.model.strategy import (
+    get_complex_utility_batch, 
+    create_select_move_by_afterstate_utility, 
+    get_weights,
+)
 from tetris.model.gameplay.common.game_state import GameState
 from tetris.model.task import TetrisTaskState
 
+# Continuous distributions rather than lists of values: with this many params, the grid 
+# of every combination of listed values is too large for the search to count.
 PARAM_DISTRIBUTIONS = dict(
-    weight_concealed_space_utility=np.arange(0, 500, 1),
-    weight_empty_row_utility=np.arange(0, 50, 0.1),
-    weight_row_sum_utility=np.arange(0, 1, 0.001),
+    weight_concealed_space_utility=randint(0, 500),
+    weight_empty_row_utility=uniform(0, 50),
+    weight_row_sum_utility=uniform(0, 1),
+    weight_column_height_utility=uniform(0, 50),
+    weight_bumpiness_utility=uniform(0, 50),
+    weight_well_utility=uniform(0, 50),
+    weight_row_transition_utility=uniform(0, 50),
+    weight_column_transition_utility=uniform(0, 50),
+    weight_lines_cleared_utility=uniform(0, 50),
 )
 
+# the number of games each set of params is scored by
+GAME_COUNT = 10
+
+# Limits on a game being scored; None for no limit. Without them, a game with good 
+# params can last for hours.
+GameBudget = namedtuple("GameBudget", "max_turn_count max_time_sec")
+GAME_BUDGET = GameBudget(max_turn_count=2000, max_time_sec=None)
+UNBOUNDED_GAME_BUDGET = GameBudget(max_turn_count=None, max_time_sec=None)
+
+GameScore = namedtuple("GameScore", "score turn_count is_truncated")
+
+
+def get_board_health(board_state):
+    """Produce a proportion estimating how far a board is from the game ending; the empty
+    rows at the top, discounted by the spaces concealed below blocks."""
+    features = dict(zip(FEATURE_NAMES, get_board_state_features(board_state)))
+    return features["empty_row"] * features["concealed_space"]
 
-def get_game_score(get_utility):
-    """Play a game of Tetris using a state utility estimator function and 
-    produce the number of turns the game lasted."""
-    select_action = create_select_action_by_utility(get_utility)
 
-    state = TetrisTaskState(GameState(create_initial_board_state(), 0))
+def get_game_score(get_utility_batch, budget=UNBOUNDED_GAME_BUDGET, piece_rng=random):
+    """Play a game of Tetris using a board grid utility estimator function and 
+    produce its score: the number of turns the game lasted.
+
+    Pieces are drawn from piece_rng. Moves tied in utility are picked from the global 
+    random, so a separate piece_rng keeps the pieces from depending on the estimator.
+
+    If the game runs out of budget, it is truncated. It then scores its turns plus
+    the share of them its board health (see get_board_health) suggests it would 
+    have survived again, so that a truncated game with a healthy board outscores 
+    one about to end."""
+    select_action = create_select_move_by_afterstate_utility(get_utility_batch)
+
+    state = TetrisTaskState(GameState(create_initial_board_state(rng=piece_rng), 0))
+    deadline = time.monotonic() + budget.max_time_sec if budget.max_time_sec is not None else None
 
     while True:
+        if (
+            (budget.max_turn_count is not None and state.state.score >= budget.max_turn_count)
+            or (deadline is not None and time.monotonic() >= deadline)
+        ):
+            turn_count = state.state.score
+            return GameScore(turn_count * (1 + get_board_health(state.state.board_state)), turn_count, True)
+
         move = select_action(state, state.possible_actions)
         if move is None:
             break
         else:
-            state = state.perform_action(move)
+            state = TetrisTaskState(
+                state.state.get_afterstate(move).with_piece_type(get_random_piece_type(piece_rng)),
+            )
+
+    return GameScore(state.state.score, state.state.score, False)
+
+
+def get_seeded_game_score(get_utility_batch, seed, budget=UNBOUNDED_GAME_BUDGET):
+    # ties are broken reproducibly too
+    random.seed(seed)
+    return get_game_score(get_utility_batch, budget, piece_rng=random.Random(seed))
+
+
+@functools.lru_cache(maxsize=None)
+def get_game_executor(worker_count):
+    """Produce a pool of worker processes for playing games, shared by every estimator."""
+    return ProcessPoolExecutor(worker_count)
+
+
+def get_seeded_game_scores(games, worker_count=1, budget=UNBOUNDED_GAME_BUDGET):
+    """Play a game for each pair of a board grid utility estimator function and a seed, 
+    in worker processes if there is more than one, and produce the GameScore of each."""
+    if worker_count > 1:
+        return list(get_game_executor(worker_count).map(
+            functools.partial(get_seeded_game_score, budget=budget), *zip(*games),
+        ))
+    else:
+        return [get_seeded_game_score(get_utility_batch, seed, budget) for get_utility_batch, seed in games]
 
-    return state.state.score
+
+def get_game_scores(get_utility_batch, game_count=GAME_COUNT, worker_count=1, budget=UNBOUNDED_GAME_BUDGET):
+    """Play games using a board grid utility estimator function and produce the 
+    GameScore of each.
+
+    Game i is seeded with i, so every estimator plays the same sequences of pieces."""
+    return get_seeded_game_scores(
+        [(get_utility_batch, seed) for seed in range(game_count)], worker_count, budget,
+    )
+
+
+def create_get_utility_batch(params):
+    return functools.partial(get_complex_utility_batch, weights=get_weights(params))
 
 
 class GameScoreEstimator(BaseEstimator, RegressorMixin):
@@ -41,32 +133,132 @@ class GameScoreEstimator(BaseEstimator, RegressorMixin):
         weight_concealed_space_utility=0, 
         weight_empty_row_utility=0, 
         weight_row_sum_utility=0,
+        weight_column_height_utility=0,
+        weight_bumpiness_utility=0,
+        weight_well_utility=0,
+        weight_row_transition_utility=0,
+        weight_column_transition_utility=0,
+        weight_lines_cleared_utility=0,
+        game_count=GAME_COUNT,
+        worker_count=1,
+        budget=GAME_BUDGET,
     ):
         self.weight_concealed_space_utility = weight_concealed_space_utility
         self.weight_empty_row_utility = weight_empty_row_utility
         self.weight_row_sum_utility = weight_row_sum_utility
+        self.weight_column_height_utility = weight_column_height_utility
+        self.weight_bumpiness_utility = weight_bumpiness_utility
+        self.weight_well_utility = weight_well_utility
+        self.weight_row_transition_utility = weight_row_transition_utility
+        self.weight_column_transition_utility = weight_column_transition_utility
+        self.weight_lines_cleared_utility = weight_lines_cleared_utility
+        self.game_count = game_count
+        self.worker_count = worker_count
+        self.budget = budget
         self.score_ = 0
+        self.score_standard_error_ = 0
+        self.truncated_game_count_ = 0
 
     def fit(self, X, y=None):
-        self.score_ = get_game_score(
-            functools.partial(
-                get_complex_utility,
-                weight_concealed_space_utility=self.weight_concealed_space_utility, 
-                weight_empty_row_utility=self.weight_empty_row_utility, 
-                weight_row_sum_utility=self.weight_row_sum_utility,
-            )
+        """Score the params by the mean score of game_count games."""
+        game_scores = get_game_scores(
+            create_get_utility_batch(self.get_params()), self.game_count, self.worker_count, self.budget,
         )
+        self.score_, self.score_standard_error_ = get_mean_and_standard_error([g.score for g in game_scores])
+        self.truncated_game_count_ = sum(g.is_truncated for g in game_scores)
         return self
 
     def predict(self, X, y=None):
         return [self.score_ for x in X]
 
     def score(self, X, y=None):
-        return sum(self.predict(X))
+        return self.score_
+
+
+TuningResult = namedtuple("TuningResult", "params score score_standard_error game_count truncated_game_count")
+
+
+def tune_move_selector_params(
+    n_iter=20, 
+    game_count=GAME_COUNT, 
+    worker_count=1, 
+    budget=GAME_BUDGET,
+    param_distributions=PARAM_DISTRIBUTIONS,
+):
+    """Search for the params with the best mean game score, producing a TuningResult 
+    with them, that mean and its standard error, and how many games were played and 
+    truncated in the whole search."""
+    # the games played by each fit are the samples, so there is a single dummy sample 
+    # and a single split
+    search = RandomizedSearchCV(
+        GameScoreEstimator(game_count=game_count, worker_count=worker_count, budget=budget), 
+        param_distributions, 
+        n_iter=n_iter,
+        scoring=dict(
+            mean=lambda estimator, X, y: estimator.score_,
+            standard_error=lambda estimator, X, y: estimator.score_standard_error_,
+            truncated_game_count=lambda estimator, X, y: estimator.truncated_game_count_,
+        ),
+        cv=[([0], [0])],
+        refit=False,
+    ).fit([[1]], y=[1])
 
+    results = search.cv_results_
+    best = int(np.argmax(results["mean_test_mean"]))
+    return TuningResult(
+        results["params"][best],
+        results["mean_test_mean"][best],
+        results["mean_test_standard_error"][best],
+        n_iter * game_count,
+        int(sum(results["mean_test_truncated_game_count"])),
+    )
+
+
+def tune_move_selector_params_by_halving(
+    candidate_count=27,
+    min_game_count=2,
+    reduction_factor=3,
+    worker_count=1,
+    budget=GAME_BUDGET,
+    param_distributions=PARAM_DISTRIBUTIONS,
+):
+    """Search for the params with the best mean game score by successive halving, 
+    producing a TuningResult as tune_move_selector_params does.
+
+    Every candidate plays min_game_count games, then only the best 1 / reduction_factor 
+    of them go on, playing reduction_factor times as many games in total, until one is 
+    left. Weak candidates are dropped after few games, so most games are spent telling 
+    good candidates apart. As with tune_move_selector_params, game i of every candidate 
+    is seeded with i."""
+    # with a factor of 1 the candidates would never be reduced
+    assert reduction_factor >= 2
+    candidates = list(ParameterSampler(param_distributions, candidate_count))
+    game_scores_by_candidate = [[] for _ in candidates]
+    survivors = list(range(len(candidates)))
+    game_count = min_game_count
+
+    while True:
+        # the games a survivor already played still count
+        games = [
+            (i, seed) for i in survivors for seed in range(len(game_scores_by_candidate[i]), game_count)
+        ]
+        game_scores = get_seeded_game_scores(
+            [(create_get_utility_batch(candidates[i]), seed) for i, seed in games], worker_count, budget,
+        )
+        for (i, _), game_score in zip(games, game_scores):
+            game_scores_by_candidate[i].append(game_score)
+
+        survivors.sort(key=lambda i: np.mean([g.score for g in game_scores_by_candidate[i]]), reverse=True)
+        survivors = survivors[:math.ceil(len(survivors) / reduction_factor)]
+        if len(survivors) == 1:
+            break
+        game_count *= reduction_factor
 
-def tune_move_selector_params(n_iter=20, n_samples=50, param_distributions=PARAM_DISTRIBUTIONS):
-    return RandomizedSearchCV(GameScoreEstimator(), param_distributions, n_iter=n_iter).fit(
-        # TODO: remove duplicate
-        tuple(1 for _ in range(n_samples)), y=tuple(1 for _ in range(n_samples)),
-    ).best_params_
+    best = survivors[0]
+    all_game_scores = [g for game_scores in game_scores_by_candidate for g in game_scores]
+    return TuningResult(
+        candidates[best], 
+        *get_mean_and_standard_error([g.score for g in game_scores_by_candidate[best]]),
+        len(all_game_scores),
+        sum(g.is_truncated for g in all_game_scores),
+    )
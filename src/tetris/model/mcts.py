@@ -1,33 +1,40 @@
-import random
-import weakref
 from dataclasses import dataclass
 from typing import Callable, List
 
-from common.model.mcts import TaskNode
+from common.model.mcts import TaskTree
+from common.util.np import get_softmax
 from tetris.model.task import TetrisTaskState
-from tetris.model.strategy import select_move_random, get_complex_utility
+from tetris.model.strategy import (
+    select_move_random, 
+    get_complex_utility, 
+    get_complex_utility_batch, 
+    get_afterstate_utilities,
+)
+
+# Utilities of the moves of a position typically differ by a few tenths, so this makes 
+# the best moves a few times as likely as average ones.
+PRIOR_TEMPERATURE = 0.1
 
 
 @dataclass
-class TetrisTaskNode(TaskNode):
+class TetrisTaskTree(TaskTree):
     select_move: Callable[[TetrisTaskState, List["Action"]], "Action"] = select_move_random
     get_utility: Callable[[TetrisTaskState], float] = get_complex_utility
+    # estimates the utility of a stack of board grids, for the priors of moves
+    get_utility_batch: Callable = get_complex_utility_batch
+
+    def perform_action(self, state, action):
+        # the next piece type is drawn at random, so each move leads to a chance node
+        # whose children are the states following each piece type
+        return state.get_afterstate(action)
 
-    def expand(self):
-        # random to avoid getting stuck with the worst move when utility is tied
-        action = select_move_random(self.state, self.unexplored_actions)
-        child = TetrisTaskNode(
-            self.state.perform_action(action), 
-            parent=weakref.proxy(self), 
-            select_move=self.select_move,
-            get_utility=self.get_utility,
-        )
-        self.action_to_child[action] = child
-        return child
-
-    def simulate(self, max_playout_depth=None):
-        state = self.state
+    def get_action_priors(self, state, actions):
+        # the utilities of the boards after all moves are evaluated at once
+        return get_softmax(get_afterstate_utilities(self.get_utility_batch, state, actions), PRIOR_TEMPERATURE)
 
+    def _play_out(self, state, max_playout_depth):
+        """Play moves from a state until the game ends or the depth is reached, producing
+        the last state and the number of moves played."""
         i = 0
         while True:
             possible_actions = state.possible_actions
@@ -36,4 +43,11 @@ class TetrisTaskNode(TaskNode):
             state = state.perform_action(self.select_move(state, possible_actions))
             i += 1
 
-        return self.get_utility(state)
+        return state, i
+
+    def simulate(self, state, max_playout_depth=None):
+        return self.get_utility(self._play_out(state, max_playout_depth)[0])
+
+    def simulate_with_playout_length(self, state, max_playout_depth=None):
+        state, playout_length = self._play_out(state, max_playout_depth)
+        return self.get_utility(state), playout_length
@@ -1,8 +1,12 @@
+import functools
 import json
 import math
 import random
 
-from common.model.task import create_select_action_by_utility
+import numpy as np
+
+from tetris.model.board import get_grids_for_rows
+from tetris.model.features import FEATURE_NAMES, get_board_state_features, get_board_features_batch
 
 
 def get_scaled_param_weights(dct):
@@ -11,85 +15,66 @@ def get_scaled_param_weights(dct):
     return {k: v / total for k, v in dct.items()}
 
 
-with open("../config/params.json") as f:
-    PARAM_WEIGHTS = get_scaled_param_weights(json.load(f))
-WEIGHT_CONCEALED_SPACE_UTILITY = PARAM_WEIGHTS["weight_concealed_space_utility"]
-WEIGHT_EMPTY_ROW_UTILITY = PARAM_WEIGHTS["weight_empty_row_utility"]
-WEIGHT_ROW_SUM_UTILITY = PARAM_WEIGHTS["weight_row_sum_utility"]
-
+def get_weight_param_name(feature_name):
+    return f"weight_{feature_name}_utility"
 
-def get_concealed_space_count_for_coord(state, row, col):
-    """Produce the number of empty spaces concealed by a block at the given position."""
-    # if there isn't a block at the coord, it's not concealing anything.
-    if state.board.is_coord_empty(row, col):
-        return 0
 
-    curr_row = row
-    while state.board.is_coord_empty(curr_row + 1, col):
-        curr_row += 1
+def get_weights(params):
+    """Produce a vector of feature weights from a dict of weight params.
 
-    return curr_row - row
+    Features without a weight param are not used."""
+    return np.array([params.get(get_weight_param_name(name), 0) for name in FEATURE_NAMES], dtype=float)
 
 
-def get_concealed_space_count(state):
-    """Produce the number of empty spaces concealed by blocks."""
-    return sum(
-        get_concealed_space_count_for_coord(
-            state, placement.row, placement.col)
-        for placement
-        in state.board.block_placements
-    )
+with open("../config/params.json") as f:
+    PARAM_WEIGHTS = get_scaled_param_weights(json.load(f))
+WEIGHTS = get_weights(PARAM_WEIGHTS)
 
+# TODO: magic number to make these vary similarly to a win/loss scheme
+UTILITY_SCALE = 20
 
-def get_unconcealed_space_proportion(state):
-    """Produce the proportion of squares that are not concealed spaces."""
-    return 1 - get_concealed_space_count(state) / (state.board.row_count * state.board.col_count)
 
+def get_complex_utility(state, weights=WEIGHTS):
+    return get_board_state_features(state.state.board_state) @ weights * UTILITY_SCALE
 
-def get_empty_row_count(state):
-    """Produce the number of empty rows."""
-    placements = state.board.block_placements
-    return min(p.row for p in placements) if placements else state.board.row_count
 
+def get_complex_utility_batch(grids, lines_cleared=None, weights=WEIGHTS):
+    """Produce the utility of each of a stack of board grids of shape 
+    (board count, row count, col count); equivalent to get_complex_utility."""
+    return get_board_features_batch(grids, lines_cleared) @ weights * UTILITY_SCALE
 
-def get_empty_row_proportion(state):
-    """Produce the proportion of rows that are empty."""
-    return get_empty_row_count(state) / state.board.row_count
 
+def get_afterstate_utilities(get_utility_batch, state, possible_moves):
+    """Produce the utility of the board resulting from each possible move, evaluated at
+    once with an estimator of the utility of a stack of board grids."""
+    afterstate_rows, lines_cleared = state.state.get_afterstates(possible_moves)
+    return get_utility_batch(
+        get_grids_for_rows(afterstate_rows, state.state.board.col_count), lines_cleared,
+    )
 
-def get_row_sum(state):
-    """Produce the sum of the row indices of all blocks."""
-    return sum(p.row for p in state.board.block_placements)
 
+def select_move_by_afterstate_utility(get_utility_batch, state, possible_moves):
+    """Select the best move by evaluating the boards resulting from all possible moves 
+    at once (see get_afterstate_utilities).
 
-def get_max_row_sum(state):
-    r = state.board.row_count
-    c = state.board.col_count
-    return r * (r - 1) * c // 2
+    If there is a tie, select one of the tied moves at random."""
+    if not possible_moves:
+        return None
 
+    utilities = get_afterstate_utilities(get_utility_batch, state, possible_moves)
+    return possible_moves[random.choice(np.flatnonzero(utilities == utilities.max()))]
 
-def get_row_sum_proportion(state):
-    """Produce the proportion of total row coordinates to the maximum possible."""
-    return get_row_sum(state) / get_max_row_sum(state)
 
+def create_select_move_by_afterstate_utility(get_utility_batch):
+    """Given an estimator of the utility of a stack of board grids, create a function 
+    that selects the best move given a state and possible moves.
 
-def get_complex_utility(
-    state,
-    weight_concealed_space_utility=WEIGHT_CONCEALED_SPACE_UTILITY,
-    weight_empty_row_utility=WEIGHT_EMPTY_ROW_UTILITY,
-    weight_row_sum_utility=WEIGHT_ROW_SUM_UTILITY,
-):
-    return (
-        get_unconcealed_space_proportion(state.state) * weight_concealed_space_utility
-        + get_empty_row_proportion(state.state) * weight_empty_row_utility
-        + get_row_sum_proportion(state.state) * weight_row_sum_utility
-    ) * 20  # TODO: magic number to make these vary similarly to a win/loss scheme
+    The function can be pickled (e.g. to be sent to another process) if the estimator can."""
+    return functools.partial(select_move_by_afterstate_utility, get_utility_batch)
 
 
-select_move_smart = create_select_action_by_utility(get_complex_utility)
+select_move_smart = create_select_move_by_afterstate_utility(get_complex_utility_batch)
 
 
 def select_move_random(state, possible_moves):
-    return random.choice(possible_moves)
-# a slower implementation of select_move_random that actually applies all possible moves
-# select_move_random = create_select_action_by_utility(lambda state: 0)
+    return random.choice(possible_moves) if possible_moves else None
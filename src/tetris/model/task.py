@@ -1,18 +1,8 @@
 from dataclasses import dataclass
 
-from common.model.task import Task, TaskState
+from common.model.task import ChanceState, TaskState
+from tetris.model.board import PieceType
 from tetris.model.gameplay.common.game_state import GameState
-from tetris.model.gameplay.common.timer import Timer
-
-
-@dataclass
-class TetrisMoveTask(Task):
-    """Adapter for the tetris move timer for the Task interface."""
-    timer: Timer
-
-    @property
-    def time_remaining(self):
-        return self.timer.time_remaining_sec
 
 
 @dataclass
@@ -27,3 +17,35 @@ class TetrisTaskState(TaskState):
 
     def perform_action(self, action):
         return TetrisTaskState(self.state.play_move(action))
+
+    def get_afterstate(self, action):
+        return TetrisAfterstate(self.state.get_afterstate(action))
+
+    def is_equivalent(self, other):
+        return self.state.board_state.has_same_position(other.state.board_state)
+
+    @property
+    def transposition_key(self):
+        return self.state.board_state.zobrist_hash
+
+
+# every piece type is equally likely to come next
+PIECE_TYPE_PROBABILITIES = {piece_type: 1 / len(PieceType) for piece_type in PieceType}
+
+
+@dataclass
+class TetrisAfterstate(ChanceState):
+    """Adapter for a tetris game state whose next piece type hasn't been drawn yet."""
+    state: GameState
+
+    @property
+    def outcome_probabilities(self):
+        return PIECE_TYPE_PROBABILITIES
+
+    def resolve(self, outcome):
+        return TetrisTaskState(self.state.with_piece_type(outcome))
+
+    @property
+    def transposition_key(self):
+        # without a piece type, this can't match the key of a TetrisTaskState
+        return self.state.board_state.zobrist_hash
@@ -0,0 +1,121 @@
+import random
+
+import pygame
+
+from tetris.model.benchmark import Benchmark, BENCHMARK_SEED, POSITION_COUNT
+from tetris.model.board import create_initial_board_state
+from tetris.model.strategy import select_move_smart
+from tetris.model.task import TetrisTaskState
+from tetris.model.gameplay.common.game_state import GameState
+from tetris.ui.game import GameDisplay, GameDisplayState, get_preview_placements
+
+# Frames are drawn to SDL's dummy video driver, so set SDL_VIDEODRIVER=dummy before 
+# pygame is initialized: this measures drawing, not the speed of a real display.
+
+
+def get_consecutive_game_states(state_count=POSITION_COUNT, seed=BENCHMARK_SEED):
+    """Produce reproducible game states of consecutive turns of a game played by 
+    select_move_smart, so each differs from the last by a move, as frames do."""
+    random.seed(seed)
+    state = TetrisTaskState(GameState(create_initial_board_state(track_cell_codes=True), 0))
+    game_states = [state.state]
+    while len(game_states) < state_count and state.possible_actions:
+        state = state.perform_action(select_move_smart(state, state.possible_actions))
+        game_states.append(state.state)
+    return game_states
+
+
+def create_display():
+    pygame.init()
+    display = GameDisplay(None)
+    display.reset_display()
+    return display
+
+
+def _get_frame_update(game_state, turn_time_remaining=10):
+    return GameDisplayState(
+        board=game_state.board,
+        preview_placements=(),
+        piece_type=game_state.piece_type,
+        score=game_state.score,
+        turn_time_remaining=turn_time_remaining,
+    )
+
+
+def _create_run_frame_first(positions):
+    display = create_display()
+    updates = [_get_frame_update(g) for g in get_consecutive_game_states()]
+
+    def run():
+        for update in updates:
+            display.reset_display()
+            display.queue_display_update(update)
+            display.update_display()
+
+    return run, len(updates)
+
+
+def _create_run_frame_move(positions):
+    display = create_display()
+    updates = [_get_frame_update(g) for g in get_consecutive_game_states()]
+
+    def run():
+        for update in updates:
+            display.queue_display_update(update)
+            display.update_display()
+
+    return run, len(updates)
+
+
+def _create_run_frame_preview(positions):
+    display = create_display()
+    game_state = get_consecutive_game_states()[-1]
+    display.queue_display_update(_get_frame_update(game_state))
+    display.update_display()
+    updates = [
+        GameDisplayState(preview_placements=get_preview_placements(game_state.board_state, m))
+        for m in game_state.possible_moves
+    ]
+
+    def run():
+        for update in updates:
+            display.queue_display_update(update)
+            display.update_display()
+
+    return run, len(updates)
+
+
+def _create_run_frame_turn_time(positions):
+    display = create_display()
+    game_state = get_consecutive_game_states()[-1]
+    display.queue_display_update(_get_frame_update(game_state))
+    display.update_display()
+    updates = [GameDisplayState(turn_time_remaining=t % 10 + 1) for t in range(POSITION_COUNT)]
+
+    def run():
+        for update in updates:
+            display.queue_display_update(update)
+            display.update_display()
+
+    return run, len(updates)
+
+
+def _create_run_frame_unchanged(positions):
+    display = create_display()
+    display.queue_display_update(_get_frame_update(get_consecutive_game_states()[-1]))
+    display.update_display()
+
+    def run():
+        for _ in range(POSITION_COUNT):
+            display.update_display()
+
+    return run, POSITION_COUNT
+
+
+UI_BENCHMARKS = (
+    Benchmark("frame_first", _create_run_frame_first),
+    Benchmark("frame_move", _create_run_frame_move),
+    Benchmark("frame_preview", _create_run_frame_preview),
+    Benchmark("frame_turn_time", _create_run_frame_turn_time),
+    Benchmark("frame_unchanged", _create_run_frame_unchanged),
+)
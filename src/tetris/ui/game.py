@@ -1,4 +1,3 @@
-import time
 from contextlib import contextmanager
 from dataclasses import dataclass, field
 from functools import cached_property
@@ -10,7 +9,7 @@ from rx.disposable import CompositeDisposable
 from rx.subject import Subject
 from rx import operators as op
 
-from tetris.model.board import PieceType, PieceOrientation, Piece
+from tetris.model.board import PieceType, PieceOrientation, Piece, GridPlacement, CELL_CODE_BIT_COUNT, CELL_CODE_MASK
 
 RGB_WHITE = (255, 255, 255)
 RGB_BLACK = (0, 0, 0)
@@ -41,7 +40,28 @@ COLOR_BY_PIECE_TYPE = {
 
 TURN_DURATION_SEC = 10
 
-pygame_scheduler = PyGameScheduler(pygame)
+# the opacity of the blocks of a move that may still change
+PREVIEW_OPACITY = 1 / 8
+
+# posted to wake the display when there is work for the scheduler
+WAKE_EVENT = pygame.USEREVENT
+# the longest the display waits for an event before checking the scheduler anyway, in
+# case work is scheduled for later rather than now
+MAX_EVENT_WAIT_MS = 1000
+
+
+class WakingPyGameScheduler(PyGameScheduler):
+    """A PyGameScheduler that posts an event whenever work is scheduled, so the display
+    can wait for events rather than poll the scheduler."""
+
+    def schedule_absolute(self, duetime, action, state=None):
+        disposable = super().schedule_absolute(duetime, action, state=state)
+        # posting events is safe from any thread
+        pygame.event.post(pygame.event.Event(WAKE_EVENT))
+        return disposable
+
+
+pygame_scheduler = WakingPyGameScheduler(pygame)
 
 
 @contextmanager
@@ -55,12 +75,14 @@ def pygame_session():
 
 @dataclass
 class GameDisplayState:
+    # a board tracking cell codes, so blocks are drawn in the color of their piece
     board: Any = None
     piece_type: Any = None
     score: Any = None
     is_game_over: Any = None
     turn_time_remaining: Any = None
-    get_block_color: Any = None
+    # placements of the blocks of a move that may still change, valued by piece type
+    preview_placements: Any = None
 
 
 def if_present(opt, default):
@@ -74,7 +96,16 @@ def update_display_state(state, update):
         score=if_present(update.score, state.score),
         is_game_over=if_present(update.is_game_over, state.is_game_over),
         turn_time_remaining=if_present(update.turn_time_remaining, state.turn_time_remaining),
-        get_block_color=if_present(update.get_block_color, state.get_block_color)
+        preview_placements=if_present(update.preview_placements, state.preview_placements),
+    )
+
+
+def get_preview_placements(board_state, move):
+    """Produce the placements of the blocks of the current piece if it were moved."""
+    piece = board_state.get_piece_for_move(move)
+    row = board_state.get_landing_row(move)
+    return tuple(
+        GridPlacement(p.row + row, p.col + move.col, piece.piece_type) for p in piece.block_placements
     )
 
 
@@ -94,10 +125,20 @@ class GameDisplay:
     text_color: Any = TEXT_COLOR
     background_color: Any = BACKGROUND_COLOR
     get_color_for_piece_type: Any = lambda piece_type: COLOR_BY_PIECE_TYPE[piece_type]
-    key_event_subject: Any = Subject()
-    state: Any = GameDisplayState()
+    key_event_subject: Any = field(default_factory=Subject)
+    state: Any = field(default_factory=GameDisplayState)
     display_caption: Any = DISPLAY_CAPTION
-    display_update_delay: Any = 0.1
+    # what is on the display, so only what changed is redrawn
+    drawn_state: Any = field(default_factory=GameDisplayState)
+    drawn_header: Any = None
+    drawn_cell_codes: Any = None
+    drawn_cell_colors: Any = None
+    drawn_preview_by_coord: Any = None
+    block_sprites: Any = field(default_factory=dict)
+    text_surfaces: Any = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.reset_drawn_state()
 
     @property
     def header_height(self):
@@ -115,20 +156,42 @@ class GameDisplay:
     def display(self):
         return pygame.display.set_mode((self.width, self.height))
 
-    def draw_background(self):
-        self.display.fill(self.background_color)
-
-    def draw_square(self, color, x, y, outline_width=0):
-        pygame.draw.rect(
-            self.display,
-            color,
-            [x, y, self.square_size, self.square_size],
-            outline_width,
+    @property
+    def header_rect(self):
+        return pygame.Rect(0, 0, self.width, self.header_height)
+
+    def get_block_sprite(self, color):
+        """Produce a surface with a block of the given color, rendered once per color."""
+        sprite = self.block_sprites.get(color)
+        if sprite is None:
+            sprite = pygame.Surface((self.square_size, self.square_size))
+            sprite.fill(color)
+            pygame.draw.rect(sprite, self.square_border_color, sprite.get_rect(), self.square_border_width)
+            self.block_sprites[color] = sprite
+        return sprite
+
+    def get_text_surface(self, key, text):
+        """Produce a surface with the given text, rendered again only when the text 
+        shown under the key changes."""
+        drawn_text, surface = self.text_surfaces.get(key, (None, None))
+        if text != drawn_text:
+            surface = self.text_font_primary.render(text, True, self.text_color)
+            self.text_surfaces[key] = (text, surface)
+        return surface
+
+    def get_block_rect(self, row, col):
+        return pygame.Rect(
+            col * self.square_size, 
+            row * self.square_size + self.header_height, 
+            self.square_size, 
+            self.square_size,
         )
 
+    def draw_background(self, rect=None):
+        self.display.fill(self.background_color, rect)
+
     def draw_block(self, color, x, y):
-        self.draw_square(color, x, y)
-        self.draw_square(self.square_border_color, x, y, self.square_border_width)
+        self.display.blit(self.get_block_sprite(color), (x, y))
 
     def draw_current_piece(self, piece_type):
         color = self.get_color_for_piece_type(piece_type)
@@ -140,111 +203,163 @@ class GameDisplay:
                 (placement.row + 1) * self.square_size,
             )
 
-    def draw_board(self, board, get_block_color):
-        for placement in board.block_placements:
-            self.draw_block(
-                get_block_color(placement.val),
-                placement.col * self.square_size,
-                placement.row * self.square_size + self.header_height,
-            )
-
     def draw_game_over(self):
-        self.display.blit(self.text_font_primary.render(
-            "Game over!", True, self.text_color), (10, 70))
+        self.display.blit(self.get_text_surface("game_over", "Game over!"), (10, 70))
 
     def draw_score(self, score):
-        self.display.blit(self.text_font_primary.render(
-            f"Score: {score}", True, self.text_color), (10, 40))
+        self.display.blit(self.get_text_surface("score", f"Score: {score}"), (10, 40))
 
     def draw_turn_time_remaining(self, turn_time_remaining):
-        self.display.blit(self.text_font_primary.render(
-            f"Time: {turn_time_remaining}", True, self.text_color), (10, 10))
+        self.display.blit(self.get_text_surface("time", f"Time: {turn_time_remaining}"), (10, 10))
+
+    def draw_header(self, piece_type, score, turn_time_remaining, is_game_over):
+        """Draw the header and produce the region drawn."""
+        self.draw_background(self.header_rect)
+        if piece_type is not None:
+            self.draw_current_piece(piece_type)
+        if score is not None:
+            self.draw_score(score)
+        if turn_time_remaining is not None:
+            self.draw_turn_time_remaining(turn_time_remaining)
+        if is_game_over:
+            self.draw_game_over()
+        return self.header_rect
+
+    def get_cell_color(self, code, preview_piece_type):
+        if code:
+            return self.get_color_for_piece_type(PieceType(code))
+        elif preview_piece_type is not None:
+            return scale_opacity(self.get_color_for_piece_type(preview_piece_type), PREVIEW_OPACITY)
+        else:
+            return None
+
+    def draw_board(self, board, preview_placements):
+        """Draw the cells whose color changed since the board was last drawn and produce
+        the regions drawn.
+
+        Rows whose cell codes are unchanged and hold no preview blocks are skipped
+        without looking at their cells."""
+        rects = []
+        preview_by_coord = {(p.row, p.col): p.val for p in preview_placements or ()}
+        preview_rows = {row for row, _ in preview_by_coord} | {row for row, _ in self.drawn_preview_by_coord}
+
+        for row, codes in enumerate(board.cell_codes):
+            if codes == self.drawn_cell_codes[row] and row not in preview_rows:
+                continue
+            drawn_colors = self.drawn_cell_colors[row]
+            for col in range(self.col_count):
+                color = self.get_cell_color(
+                    codes >> col * CELL_CODE_BIT_COUNT & CELL_CODE_MASK, preview_by_coord.get((row, col)),
+                )
+                if color != drawn_colors[col]:
+                    rect = self.get_block_rect(row, col)
+                    if color is None:
+                        self.draw_background(rect)
+                    else:
+                        self.display.blit(self.get_block_sprite(color), rect)
+                    drawn_colors[col] = color
+                    rects.append(rect)
+
+        self.drawn_cell_codes = board.cell_codes
+        self.drawn_preview_by_coord = preview_by_coord
+        return rects
 
     def queue_display_update(self, update):
         self.state = update_display_state(self.state, update)
 
     def update_display(self):
+        """Redraw the parts of the display that changed since it was last updated."""
         s = self.state
-
+        if s is self.drawn_state:
+            return
+
+        rects = []
+
+        header = (s.piece_type, s.score, s.turn_time_remaining, s.is_game_over)
+        if header != self.drawn_header:
+            rects.append(self.draw_header(*header))
+            self.drawn_header = header
+
+        if s.board is not None and (
+            s.board is not self.drawn_state.board or s.preview_placements is not self.drawn_state.preview_placements
+        ):
+            rects.extend(self.draw_board(s.board, s.preview_placements))
+
+        self.drawn_state = s
+        if rects:
+            pygame.display.update(rects)
+
+    def reset_drawn_state(self):
+        self.drawn_state = GameDisplayState()
+        self.drawn_header = None
+        self.drawn_cell_codes = (0,) * self.row_count
+        self.drawn_cell_colors = [[None] * self.col_count for _ in range(self.row_count)]
+        self.drawn_preview_by_coord = {}
+
+    def reset_display(self):
+        """Clear the display, so the next update draws everything."""
         self.draw_background()
-
-        if s.piece_type is not None:
-            self.draw_current_piece(s.piece_type)
-        if s.board is not None and s.get_block_color is not None:
-            self.draw_board(s.board, s.get_block_color)
-        if s.score is not None:
-            self.draw_score(s.score)
-        if s.turn_time_remaining is not None:
-            self.draw_turn_time_remaining(s.turn_time_remaining)
-        if s.is_game_over:
-            self.draw_game_over()
-
         pygame.display.flip()
+        self.reset_drawn_state()
 
     def run(self):
         pygame.display.set_caption(self.display_caption)
+        self.reset_display()
 
         while True:
-            pygame_scheduler.run()
+            # wait for input or for work from the scheduler rather than poll for either
+            events = [pygame.event.wait(MAX_EVENT_WAIT_MS), *pygame.event.get()]
 
-            for event in pygame.event.get():
+            for event in events:
                 if event.type == pygame.QUIT:
                     return
                 elif event.type == pygame.KEYDOWN:
                     self.key_event_subject.on_next(event)
 
+            pygame_scheduler.run()
             self.update_display()
 
-            time.sleep(self.display_update_delay)
-
     def run_game(self):
-        color_by_block = {}
-
         def end_game():
             game_disposable.dispose()
 
             self.queue_display_update(GameDisplayState(is_game_over=True))
             
         def handle_move(game_state, move, is_move_final):
-            nonlocal color_by_block
-
             if game_state is None:
                 return
 
-            piece = game_state.get_piece_for_move(move)
-            piece_color = self.get_color_for_piece_type(piece.piece_type)
-
-            if not is_move_final:
-                piece_color = scale_opacity(piece_color, 1 / 8)
-
-            new_game_state = game_state.play_move(move)
-            new_color_by_block = {**{p.val: piece_color for p in piece.block_placements}, **color_by_block}
-
             if is_move_final:
-                # throw out blocks that have been cleared
-                new_game_state_blocks = set(p.val for p in new_game_state.board.block_placements)
-                color_by_block = {
-                    b: c for b, c in new_color_by_block.items() if b in new_game_state_blocks
-                }
-
-            self.queue_display_update(
-                GameDisplayState(
+                new_game_state = game_state.play_move(move)
+                update = GameDisplayState(
                     board=new_game_state.board,
-                    get_block_color=lambda b: new_color_by_block[b],
+                    preview_placements=(),
                     piece_type=game_state.piece_type,
-                    score=new_game_state.score if is_move_final else None,
+                    score=new_game_state.score,
                 )
-            )
+            else:
+                # the board only changes once the move is final; until then, the piece 
+                # is drawn where it would land
+                update = GameDisplayState(
+                    board=game_state.board,
+                    preview_placements=get_preview_placements(game_state.board_state, move),
+                    piece_type=game_state.piece_type,
+                )
+            self.queue_display_update(update)
 
+        # the game emits on its own threads; observing on the scheduler hands updates to
+        # the display's thread and wakes it (see WakingPyGameScheduler)
         game_disposable = CompositeDisposable(
-            self.conductor.move_subject.subscribe(
+            self.conductor.move_subject.pipe(
+                op.observe_on(pygame_scheduler),
+            ).subscribe(
                 on_next=lambda v: handle_move(*v) if v is not None else None, 
                 on_completed=end_game,
-                scheduler=pygame_scheduler,
             ),
-            self.conductor.turn_time_remaining_subject.subscribe(
+            self.conductor.turn_time_remaining_subject.pipe(
+                op.observe_on(pygame_scheduler),
+            ).subscribe(
                 lambda t: self.queue_display_update(GameDisplayState(turn_time_remaining=t)),
-                scheduler=pygame_scheduler,
             ),
         )
 
@@ -2,18 +2,39 @@ import json
 
 import click
 
-from tetris.model.hyperparameters import tune_move_selector_params
+from tetris.model.hyperparameters import (
+    GAME_BUDGET,
+    GAME_COUNT, 
+    GameBudget,
+    tune_move_selector_params, 
+    tune_move_selector_params_by_halving,
+)
 from common.util.np import NumpyJsonEncoder
 
 
 @click.command()
+@click.option("--method", type=click.Choice(["random", "halving"]), default="random", help="Random search plays the same number of games for every set of parameters; successive halving drops the worst sets after a few games.")
 @click.option("--iter-count", default=20, help="Number of iterations or (sets of parameters attempted) of random hyperparameter search; larger values will return more accurate yet slower results.")
-@click.option("--sample-count", default=50, help="Number of samples tried per each hyperparameter set; larger values will return more accurate yet slower results. Must be greater than 5.")
+@click.option("--game-count", default=GAME_COUNT, help="Number of games each hyperparameter set is scored by in random search; larger values will return more accurate yet slower results.")
+@click.option("--min-game-count", default=2, help="Number of games every hyperparameter set plays before the first halving.")
+@click.option("--halving-factor", default=3, type=click.IntRange(min=2), help="Factor by which each halving reduces the hyperparameter sets and multiplies the games they play.")
+@click.option("--max-turns", default=GAME_BUDGET.max_turn_count, type=int, help="Number of turns after which a game is truncated and scored by its turns and board health; 0 for no limit.")
+@click.option("--max-game-time", default=None, type=float, help="Duration in seconds after which a game is truncated, as with --max-turns.")
+@click.option("--workers", default=1, help="Number of processes playing games in parallel.")
 @click.option("--path", default="../config/params.json", help="Output file for new params in JSON format.")
-def tune(iter_count, sample_count, path):
+def tune(method, iter_count, game_count, min_game_count, halving_factor, max_turns, max_game_time, workers, path):
+    budget = GameBudget(max_turns or None, max_game_time)
+    if method == "halving":
+        result = tune_move_selector_params_by_halving(
+            iter_count, min_game_count, halving_factor, workers, budget,
+        )
+    else:
+        result = tune_move_selector_params(iter_count, game_count, workers, budget)
+    click.echo(f"best mean game score: {result.score:.1f} ± {result.score_standard_error:.1f}")
+    click.echo(f"truncated games: {result.truncated_game_count} of {result.game_count}")
     with open(path, "w") as f:
-        json.dump(tune_move_selector_params(iter_count, sample_count), f, cls=NumpyJsonEncoder)
-        
+        json.dump(result.params, f, cls=NumpyJsonEncoder)
+
 
 
 if __name__ == "__main__":
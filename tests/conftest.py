@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the packages live in src, where the scripts are run from; some modules read files 
+# relative to it
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+os.chdir(SRC_DIR)
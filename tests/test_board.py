@@ -0,0 +1,65 @@
+import random
+
+from tetris.model.board import BoardState, create_initial_board_state
+from tetris.model.features import get_board_state_features
+
+GAME_COUNT = 300
+
+
+def get_naive_move_result(grid, piece, col):
+    """Drop a piece on a grid of piece types (None for empty cells) by moving it down a
+    row at a time, then clear full rows, producing the new grid and the number of rows
+    cleared."""
+    row_count, col_count = len(grid), len(grid[0])
+
+    def fits(row):
+        return all(
+            row + p.row < row_count and grid[row + p.row][col + p.col] is None
+            for p in piece.block_placements
+        )
+
+    row = 0
+    while fits(row + 1):
+        row += 1
+    grid = [list(cells) for cells in grid]
+    for p in piece.block_placements:
+        grid[row + p.row][col + p.col] = piece.piece_type
+
+    kept_rows = [cells for cells in grid if None in cells]
+    cleared_count = row_count - len(kept_rows)
+    return [[None] * col_count for _ in range(cleared_count)] + kept_rows, cleared_count
+
+
+def get_grid(board):
+    return [
+        [board.get_cell_piece_type(row, col) for col in range(board.col_count)]
+        for row in range(board.row_count)
+    ]
+
+
+def test_running_values_match_board_and_naive_engine():
+    for seed in range(GAME_COUNT):
+        random.seed(seed)
+        rng = random.Random(seed)
+        state = create_initial_board_state(track_cell_codes=True)
+        grid = get_grid(state.board)
+
+        while state.possible_moves:
+            move = rng.choice(state.possible_moves)
+            grid, cleared_count = get_naive_move_result(grid, state.get_piece_for_move(move), move.col)
+            state = state.play_move(move)
+            # the lines cleared come from the move rather than the board
+            expected = BoardState(state.board, state.piece_type, lines_cleared=cleared_count)
+
+            assert get_grid(state.board) == grid
+            assert state.board.rows == tuple(
+                sum(1 << col for col, cell in enumerate(cells) if cell is not None) for cells in grid
+            )
+            assert state.lines_cleared == cleared_count
+            assert state.column_heights == expected.column_heights
+            assert state.block_count == expected.block_count
+            assert state.row_sum == expected.row_sum
+            assert state.highest_row == expected.highest_row
+            assert state.board_hash == expected.board_hash
+            assert state.zobrist_hash == expected.zobrist_hash
+            assert list(get_board_state_features(state)) == list(get_board_state_features(expected))
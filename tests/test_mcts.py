@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from common.model.mcts import NO_CHILDREN, ROOT, TaskTree, get_selection_values_uct
+from common.model.task import TaskState
+
+
+@dataclass
+class CountdownState(TaskState):
+    """A state counting down to zero by one or two at a time."""
+    count: int
+
+    @property
+    def possible_actions(self):
+        return [a for a in (1, 2) if a <= self.count]
+
+    def perform_action(self, action):
+        return CountdownState(self.count - action)
+
+
+@dataclass
+class CountdownTree(TaskTree):
+    def simulate(self, state, max_playout_depth=None):
+        return -state.count
+
+
+def get_selection_values_worst(playout_counts, playout_utility_sums, parent_playout_count):
+    return -playout_utility_sums / playout_counts
+
+
+def test_subtree_with_terminal_node_expanded_last():
+    tree = CountdownTree(CountdownState(2))
+    # both children of the root, then the terminal child of the one counting down by one, 
+    # which is expanded in the last iteration
+    for _ in range(4):
+        tree._iterate(get_selection_values_worst, None)
+    terminal = tree.node_count - 1
+    assert tree.states[terminal] == CountdownState(0)
+    assert tree.first_children[terminal] == NO_CHILDREN
+
+    subtree = tree.get_subtree_for_state(CountdownState(1))
+
+    assert subtree.node_count == 2
+    assert subtree.playout_counts[ROOT] == 3
+    assert subtree.first_children[1] == NO_CHILDREN
+    assert not subtree.get_children(1)
+    assert subtree._iterate(get_selection_values_worst, None) == [ROOT, 1]
+
+
+def test_prune_keeps_states_for_re_rooting():
+    tree = CountdownTree(CountdownState(8))
+    for _ in range(200):
+        tree._iterate(get_selection_values_uct, None)
+
+    tree.prune(20)
+
+    depths = tree.get_node_depths()
+    played = tree.playout_counts[:tree.node_count] > 0
+    assert all(tree.states[node] is not None for node in np.flatnonzero(played & (depths <= 2)).tolist())
+    assert tree.get_subtree_for_state(CountdownState(6)) is not None
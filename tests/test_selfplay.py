@@ -0,0 +1,11 @@
+import random
+
+from tetris.model.gameplay.selfplay import create_computer_player, play_game
+
+
+def test_random_player_plays_game_to_completion():
+    random.seed(0)
+    record = play_game(create_computer_player("random"), max_turn_duration=1)
+
+    assert record["pieces_placed"] > 0
+    assert not record["is_truncated"]